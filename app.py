@@ -5,16 +5,29 @@ Aplicación Streamlit que permite a los administradores del club
 hacer preguntas en lenguaje natural sobre ocupación, reservas, ingresos y operaciones.
 """
 
+from __future__ import annotations
+
+import hashlib
+import json
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from itertools import chain
+from typing import TYPE_CHECKING, Iterator
+from zoneinfo import ZoneInfo
 
 import streamlit as st
 from dotenv import load_dotenv
 
-from playtomic_api import PlaytomicAPI
-from llm_agent import PlaytomicAgent
-from charts import build_charts
+# openai, plotly y los módulos del agente se importan al primer uso: así el
+# arranque en frío (y la pantalla de configuración faltante) no los carga.
+if TYPE_CHECKING:
+    import openai
 
-load_dotenv()
+    from playtomic_api import PlaytomicAPI
+    from llm_agent import PlaytomicAgent
 
 
 def get_secret(key: str, default: str = "") -> str:
@@ -27,23 +40,46 @@ def get_secret(key: str, default: str = "") -> str:
 
 # ── Configuración ───────────────────────────────────────────────────────
 
-CLIENT_ID = get_secret("PLAYTOMIC_CLIENT_ID")
-CLIENT_SECRET = get_secret("PLAYTOMIC_CLIENT_SECRET")
-TENANT_ID = get_secret("PLAYTOMIC_TENANT_ID")
-OPENAI_KEY = get_secret("OPENAI_API_KEY")
-OPENAI_MODEL = get_secret("OPENAI_MODEL", "gpt-4o")
-CLUB_TIMEZONE = get_secret("CLUB_TIMEZONE", "America/Cancun")
+CONFIG_DEFAULTS = {
+    "PLAYTOMIC_CLIENT_ID": "",
+    "PLAYTOMIC_CLIENT_SECRET": "",
+    "PLAYTOMIC_TENANT_ID": "",
+    "OPENAI_API_KEY": "",
+    "OPENAI_MODEL": "gpt-4o",
+    "CLUB_TIMEZONE": "America/Cancun",
+}
+
+
+@st.cache_resource(show_spinner=False)
+def load_config() -> dict[str, str]:
+    """Resuelve secrets/.env una sola vez por proceso, no en cada rerun."""
+    load_dotenv()
+    return {key: get_secret(key, default) for key, default in CONFIG_DEFAULTS.items()}
+
+
+config = load_config()
+CLIENT_ID = config["PLAYTOMIC_CLIENT_ID"]
+CLIENT_SECRET = config["PLAYTOMIC_CLIENT_SECRET"]
+TENANT_ID = config["PLAYTOMIC_TENANT_ID"]
+OPENAI_KEY = config["OPENAI_API_KEY"]
+OPENAI_MODEL = config["OPENAI_MODEL"]
+CLUB_TIMEZONE = config["CLUB_TIMEZONE"]
+
+APP_NAME = "UtopIA"
+CLUB_NAME = "Utopia Padel Cancún"
+ASSISTANT_AVATAR = "🎾"
+AVATARS = {"assistant": ASSISTANT_AVATAR, "user": None}
 
 # ── Página ──────────────────────────────────────────────────────────────
 
 st.set_page_config(
-    page_title="UtopIA — Utopia Padel Cancún",
-    page_icon="🎾",
+    page_title=f"{APP_NAME} — {CLUB_NAME}",
+    page_icon=ASSISTANT_AVATAR,
     layout="wide",
     initial_sidebar_state="collapsed",
 )
 
-st.markdown("""
+APP_CSS = """
 <style>
     .stApp { max-width: 1200px; margin: 0 auto; }
     div[data-testid="stChatMessage"] { padding: 1rem; }
@@ -57,7 +93,11 @@ st.markdown("""
     [data-testid="stHeader"] a[href*="github"] { display: none !important; }
     footer { visibility: hidden; }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# st.html con solo <style> se envía al contenedor de eventos: no ocupa un
+# bloque en la página ni pasa por el parser de markdown en cada rerun.
+st.html(APP_CSS)
 
 # ── Barra lateral ──────────────────────────────────────────────────────
 
@@ -70,27 +110,38 @@ QUICK_PROMPTS = {
     "🕐 Disponibilidad mañana": "¿Qué disponibilidad hay mañana? ¿Qué canchas están libres?",
 }
 
+
+# Los botones usan callbacks: se ejecutan antes del rerun que dispara el clic,
+# así que no hace falta un st.rerun() adicional para reflejar el cambio.
+def queue_prompt(prompt_text: str):
+    st.session_state.pending_prompt = prompt_text
+
+
+def clear_conversation():
+    st.session_state.messages = []
+    st.session_state.pop("pending_prompt", None)
+    if "agent" in st.session_state:
+        st.session_state.agent.reset_conversation()
+
+
 with st.sidebar:
-    st.title("UtopIA")
-    st.caption("Asistente Inteligente — Utopia Padel Cancún")
+    st.title(APP_NAME)
+    st.caption(f"Asistente Inteligente — {CLUB_NAME}")
     st.divider()
 
     st.subheader("Consultas rápidas")
     for label, prompt_text in QUICK_PROMPTS.items():
-        if st.button(label, use_container_width=True, key=f"qp_{label}"):
-            st.session_state.pending_prompt = prompt_text
+        st.button(
+            label, use_container_width=True, key=f"qp_{label}",
+            on_click=queue_prompt, args=(prompt_text,),
+        )
 
     st.divider()
 
-    if st.button("🗑️ Limpiar conversación", use_container_width=True):
-        st.session_state.messages = []
-        st.session_state.pop("pending_prompt", None)
-        if "agent" in st.session_state:
-            st.session_state.agent.reset_conversation()
-        st.rerun()
+    st.button("🗑️ Limpiar conversación", use_container_width=True, on_click=clear_conversation)
 
     st.divider()
-    st.caption("Hecho con UtopIA + Playtomic API")
+    st.caption(f"Hecho con {APP_NAME} + Playtomic API")
 
 # ── Validar configuración ──────────────────────────────────────────────
 
@@ -102,7 +153,7 @@ if not TENANT_ID:
 if not OPENAI_KEY:
     missing.append("OPENAI_API_KEY")
 
-st.header("UtopIA")
+st.header(APP_NAME)
 
 if missing:
     st.error("Falta configuración en el archivo `.env`:")
@@ -112,14 +163,37 @@ if missing:
 
 # ── Inicializar agente ─────────────────────────────────────────────────
 
+
+@st.cache_resource(show_spinner=False)
+def get_api(client_id: str, client_secret: str, tz_name: str) -> PlaytomicAPI:
+    """Cliente Playtomic compartido por todas las sesiones (un solo token OAuth)."""
+    from playtomic_api import PlaytomicAPI
+
+    return PlaytomicAPI(client_id, client_secret, tz_name=tz_name)
+
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key: str) -> openai.OpenAI:
+    """Cliente OpenAI compartido por todas las sesiones (un solo pool de conexiones)."""
+    import openai
+
+    from llm_agent import OPENAI_MAX_RETRIES
+
+    return openai.OpenAI(api_key=api_key, max_retries=OPENAI_MAX_RETRIES)
+
+
+# El agente guarda el historial de la conversación, así que sigue siendo
+# uno por sesión; solo los clientes HTTP se comparten entre sesiones.
 if "agent" not in st.session_state:
-    api = PlaytomicAPI(CLIENT_ID, CLIENT_SECRET, tz_name=CLUB_TIMEZONE)
+    from llm_agent import PlaytomicAgent
+
     st.session_state.agent = PlaytomicAgent(
-        api=api,
+        api=get_api(CLIENT_ID, CLIENT_SECRET, CLUB_TIMEZONE),
         tenant_id=TENANT_ID,
         openai_api_key=OPENAI_KEY,
         model=OPENAI_MODEL,
         timezone_name=CLUB_TIMEZONE,
+        client=get_openai_client(OPENAI_KEY),
     )
 
 agent = st.session_state.agent
@@ -131,9 +205,9 @@ if "messages" not in st.session_state:
 
 # Mensaje de bienvenida
 if not st.session_state.messages:
-    with st.chat_message("assistant", avatar="🎾"):
+    with st.chat_message("assistant", avatar=ASSISTANT_AVATAR):
         st.markdown(
-            "¡Hola! Soy **UtopIA**, tu asistente inteligente de **Utopia Padel Cancún**. "
+            f"¡Hola! Soy **{APP_NAME}**, tu asistente inteligente de **{CLUB_NAME}**. "
             "Te puedo ayudar con:\n\n"
             '- **Ocupación de canchas** — *"¿Qué tan lleno está el club mañana?"*\n'
             '- **Detalle de reservas** — *"¿Quién jugó en Hirostar ayer?"*\n'
@@ -143,13 +217,189 @@ if not st.session_state.messages:
             "¡Pregúntame lo que necesites!"
         )
 
-# Historial del chat
-for msg in st.session_state.messages:
-    avatar = "🎾" if msg["role"] == "assistant" else None
-    with st.chat_message(msg["role"], avatar=avatar):
-        st.markdown(msg["content"])
-        for i, fig in enumerate(msg.get("charts", [])):
-            st.plotly_chart(fig, use_container_width=True, key=f"hist_{id(msg)}_{i}")
+# Historial del chat — solo se renderizan los últimos mensajes; los anteriores
+# se envían al navegador únicamente cuando el usuario los pide.
+HISTORY_WINDOW = 50
+
+
+@st.cache_data(show_spinner=False, max_entries=500)
+def render_chart_spec(spec: str, key: str):
+    """Renderiza un gráfico ya serializado; en reruns Streamlit reproduce el
+    elemento desde caché sin reconstruir ni re-serializar la figura.
+
+    Se entrega como Figure sin validar: con un dict, st.plotly_chart vuelve a
+    validar la figura completa contra el esquema de Plotly, y el JSON ya salió
+    de charts.py."""
+    from plotly.graph_objects import Figure
+
+    st.plotly_chart(Figure(json.loads(spec), _validate=False), use_container_width=True, key=key)
+
+
+def render_messages(messages: list[dict]):
+    for msg in messages:
+        with st.chat_message(msg["role"], avatar=AVATARS.get(msg["role"])):
+            st.markdown(msg["content"])
+            for i, spec in enumerate(msg.get("chart_specs", [])):
+                render_chart_spec(spec, key=f"hist_{id(msg)}_{i}")
+
+
+# Fragmento: mostrar/ocultar mensajes anteriores solo re-ejecuta el historial,
+# no la configuración, la barra lateral ni el resto del script. El chat_input
+# queda fuera para que siga anclado al fondo de la página.
+@st.fragment
+def chat_history():
+    history = st.session_state.messages
+    older, recent = history[:-HISTORY_WINDOW], history[-HISTORY_WINDOW:]
+    if older and st.toggle(f"Mostrar {len(older)} mensajes anteriores", key="show_older"):
+        render_messages(older)
+    render_messages(recent)
+
+
+chat_history()
+
+
+# ── Caché de respuestas ────────────────────────────────────────────────
+
+RESPONSE_CACHE_TTL = 600  # segundos; menos si el turno consultó datos de hoy
+RESPONSE_CACHE_SIZE = 200
+
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache() -> tuple[threading.Lock, dict]:
+    """Caché compartido entre sesiones: clave -> (expira_en, respuesta, datos_gráficos).
+
+    Cada sesión corre en su propio hilo, así que lecturas, altas y desalojos
+    van bajo el lock que lo acompaña.
+    """
+    return threading.Lock(), {}
+
+
+def response_cache_key(prompt: str, history: list[dict]) -> str:
+    """Prompt normalizado + contexto reciente + día local del club.
+
+    Las consultas rápidas son autocontenidas, así que no dependen del historial.
+    """
+    context = ""
+    if prompt not in QUICK_PROMPTS.values():
+        context = json.dumps([(m["role"], m["content"]) for m in history[-4:]])
+    today = datetime.now(ZoneInfo(CLUB_TIMEZONE)).date().isoformat()
+    raw = "\x1f".join((" ".join(prompt.casefold().split()), context, today))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+@st.cache_resource(show_spinner=False)
+def get_chart_pool() -> ThreadPoolExecutor:
+    """Hilos compartidos para construir gráficos mientras se transmite la respuesta."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="charts")
+
+
+def prebuild_charts(stream: Iterator[str], agent: PlaytomicAgent, pending: list[Future]) -> Iterator[str]:
+    """Reenvía el stream del agente y construye en segundo plano los gráficos de
+    cada resultado que aparece en agent.last_chart_data mientras el modelo sigue
+    escribiendo. Al terminar el stream, todos quedan encargados (en pending) y
+    sus figuras acaban en la caché de charts.build_chart_specs."""
+    from charts import build_chart_specs
+
+    def submit_new():
+        pool = get_chart_pool()
+        pending.extend(
+            pool.submit(build_chart_specs, tool_name, tool_result)
+            for tool_name, tool_result in agent.last_chart_data[len(pending):]
+        )
+
+    for chunk in stream:
+        if len(agent.last_chart_data) > len(pending):
+            submit_new()
+        yield chunk
+    submit_new()
+
+
+def ask_agent(agent: PlaytomicAgent, prompt: str, history: list[dict]) -> tuple[str, list]:
+    """Muestra la respuesta desde caché si la misma pregunta se hizo hace poco;
+    si no, la transmite desde el agente a medida que se genera."""
+    lock, cache = get_response_cache()
+    key = response_cache_key(prompt, history)
+    with lock:
+        hit = cache.get(key)
+    if hit and hit[0] > time.time():
+        _, response, chart_data = hit
+        agent.record_exchange(prompt, response)
+        st.markdown(response)
+        return response, chart_data
+
+    # El spinner solo cubre la espera hasta el primer texto (rondas de
+    # herramientas incluidas); el resto de la respuesta se ve mientras llega.
+    pending: list[Future] = []
+    stream = prebuild_charts(agent.stream_chat(prompt), agent, pending)
+    with st.spinner("Analizando los datos del club..."):
+        first_chunk = next(stream, "")
+    response = st.write_stream(chain((first_chunk,), stream))
+    wait(pending)
+    chart_data = agent.last_chart_data
+    # Un fallo (herramienta con error, respuesta de respaldo) no se reparte a
+    # otras sesiones, y la respuesta no vive más que los datos en que se basa.
+    if agent.last_turn_ok:
+        ttl = min(RESPONSE_CACHE_TTL, agent.last_turn_ttl or RESPONSE_CACHE_TTL)
+        with lock:
+            cache[key] = (time.time() + ttl, response, chart_data)
+            if len(cache) > RESPONSE_CACHE_SIZE:
+                cache.pop(next(iter(cache)), None)
+    return response, chart_data
+
+
+DUPLICATE_PROMPT_WINDOW = 3  # segundos
+
+
+def is_duplicate_prompt(prompt: str) -> bool:
+    """True si el prompt repite el que se acaba de responder (doble clic/envío)."""
+    msgs = st.session_state.messages
+    recent = time.time() - st.session_state.get("last_submit", 0.0) < DUPLICATE_PROMPT_WINDOW
+    return (
+        recent
+        and len(msgs) >= 2
+        and msgs[-1]["role"] == "assistant"
+        and msgs[-2]["role"] == "user"
+        and msgs[-2]["content"] == prompt
+    )
+
+
+def handle_prompt(prompt: str, agent: PlaytomicAgent):
+    """Procesa un turno completo: mensaje del usuario, respuesta y gráficos."""
+    from charts import build_chart_specs
+
+    if is_duplicate_prompt(prompt):
+        return
+    st.session_state.last_submit = time.time()
+
+    history = list(st.session_state.messages)
+    st.session_state.messages.append({"role": "user", "content": prompt})
+    with st.chat_message("user", avatar=AVATARS["user"]):
+        st.markdown(prompt)
+
+    with st.chat_message("assistant", avatar=AVATARS["assistant"]):
+        try:
+            response, chart_data = ask_agent(agent, prompt, history)
+
+            # La sesión solo guarda el JSON de las figuras, y el render usa la
+            # misma clave que tendrá en el historial para que el próximo rerun
+            # lo reproduzca desde caché.
+            chart_specs = [
+                spec
+                for tool_name, tool_result in chart_data
+                for spec in build_chart_specs(tool_name, tool_result)
+            ]
+            msg = {"role": "assistant", "content": response, "chart_specs": chart_specs}
+            for i, spec in enumerate(chart_specs):
+                render_chart_spec(spec, key=f"hist_{id(msg)}_{i}")
+
+            st.session_state.messages.append(msg)
+        except Exception as e:
+            error_msg = f"Lo siento, ocurrió un error: {str(e)}"
+            st.error(error_msg)
+            st.session_state.messages.append(
+                {"role": "assistant", "content": error_msg}
+            )
+
 
 # Determinar si hay un prompt pendiente (sidebar o chat)
 prompt_to_process = st.session_state.pop("pending_prompt", None)
@@ -159,31 +409,4 @@ if user_input:
     prompt_to_process = user_input
 
 if prompt_to_process:
-    st.session_state.messages.append({"role": "user", "content": prompt_to_process})
-    with st.chat_message("user"):
-        st.markdown(prompt_to_process)
-
-    with st.chat_message("assistant", avatar="🎾"):
-        with st.spinner("Analizando los datos del club..."):
-            try:
-                response, chart_data = agent.chat(prompt_to_process)
-                st.markdown(response)
-
-                all_figures = []
-                for tool_name, tool_result in chart_data:
-                    all_figures.extend(build_charts(tool_name, tool_result))
-
-                for i, fig in enumerate(all_figures):
-                    st.plotly_chart(fig, use_container_width=True, key=f"new_{i}")
-
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response,
-                    "charts": all_figures,
-                })
-            except Exception as e:
-                error_msg = f"Lo siento, ocurrió un error: {str(e)}"
-                st.error(error_msg)
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": error_msg}
-                )
+    handle_prompt(prompt_to_process, agent)
@@ -5,8 +5,17 @@ Cada función recibe datos crudos de las herramientas y retorna una lista de
 figuras Plotly listas para renderizar en Streamlit.
 """
 
-import plotly.graph_objects as go
-import plotly.express as px
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from plotly.graph_objects import Figure
+
+logger = logging.getLogger(__name__)
 
 # ── Tema compartido ────────────────────────────────────────────────────
 
@@ -20,7 +29,18 @@ COLORS = {
     "bg": "#FFFFFF",
 }
 
-PALETTE = ["#1B998B", "#2D3047", "#E84855", "#FF9B71", "#5C6BC0", "#AB47BC", "#26A69A", "#EF5350"]
+PALETTE = ("#1B998B", "#2D3047", "#E84855", "#FF9B71", "#5C6BC0", "#AB47BC", "#26A69A", "#EF5350")
+# Prefijos de la paleta precalculados: _PALETTE_SLICES[n] == PALETTE[:n].
+_PALETTE_SLICES = tuple(PALETTE[:i] for i in range(len(PALETTE) + 1))
+
+DAY_ORDER = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo")
+WEEKEND = frozenset(("Sábado", "Domingo"))
+
+# Franja horaria de los mapas de calor (07:00–23:00) y sus etiquetas, compartidas por todas las figuras.
+HOURS = tuple(range(7, 24))
+N_HOURS = len(HOURS)
+HOUR_LABELS = tuple(f"{h:02d}:00" for h in HOURS)
+_COURT_LABELS = tuple(f"Cancha {i + 1}" for i in range(32))
 
 LAYOUT_BASE = dict(
     font=dict(family="Inter, sans-serif", size=13),
@@ -30,133 +50,210 @@ LAYOUT_BASE = dict(
 )
 
 
-def _apply_layout(fig: go.Figure, title: str, height: int = 380) -> go.Figure:
-    fig.update_layout(title=dict(text=title, font_size=16), height=height, **LAYOUT_BASE)
-    fig.update_xaxes(showgrid=True, gridcolor="#f0f0f0")
-    fig.update_yaxes(showgrid=True, gridcolor="#f0f0f0")
-    return fig
+def _trace(kind: str, **props) -> dict:
+    """Traza como dict plano; las propiedades anidadas (marker, line...) van como dicts."""
+    return {"type": kind, **props}
+
+
+def _hour(iso: str) -> int:
+    """Hora de un ISO 'YYYY-MM-DDTHH:MM...' por posición fija, sin split()."""
+    return int(iso[11:13])
+
+
+def _palette(n: int) -> tuple[str, ...]:
+    """Primeros n colores de PALETTE sin cortar la tupla en cada figura."""
+    return _PALETTE_SLICES[min(n, len(PALETTE))]
+
+
+def _court_labels(n: int) -> tuple[str, ...]:
+    """'Cancha 1'..'Cancha n', precalculadas para los clubes habituales."""
+    if n <= len(_COURT_LABELS):
+        return _COURT_LABELS[:n]
+    return tuple(f"Cancha {i + 1}" for i in range(n))
+
+
+def _unzip(d: dict) -> tuple[list, list]:
+    """(claves, valores) de un dict no vacío recorriéndolo una sola vez."""
+    keys, values = zip(*d.items())
+    return list(keys), list(values)
+
+
+def _ints(values) -> np.ndarray:
+    """Arreglo int32: Plotly lo serializa como typed array en base64, no elemento a elemento."""
+    return np.asarray(values, dtype=np.int32)
+
+
+def _floats(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def _figure(*traces: dict, layout: Optional[dict] = None) -> Figure:
+    """
+    Figura sin pasar por los validadores de plotly.graph_objects.
+
+    El layout se entrega al constructor: asignar fig.layout después hace una
+    copia profunda de todo el layout (plantilla incluida) en cada figura.
+    """
+    return Figure(data=list(traces), layout=layout, _validate=False)
+
+
+AXIS_BASE = dict(showgrid=True, gridcolor="#f0f0f0")
+
+# Bandas fijas de los indicadores tipo gauge, compartidas entre llamadas.
+OCCUPANCY_STEPS = (
+    {"range": [0, 30], "color": "#e8f5e9"},
+    {"range": [30, 70], "color": "#fff9c4"},
+    {"range": [70, 100], "color": "#ffebee"},
+)
+ACTIVE_PLAYERS_STEPS = (
+    {"range": [0, 25], "color": "#ffebee"},
+    {"range": [25, 60], "color": "#fff9c4"},
+    {"range": [60, 100], "color": "#e8f5e9"},
+)
+CANCELLATION_STEPS = (
+    {"range": [0, 10], "color": "#e8f5e9"},
+    {"range": [10, 20], "color": "#fff9c4"},
+    {"range": [20, 50], "color": "#ffebee"},
+)
+GAUGE_THRESHOLD_LINE = {"color": COLORS["accent"], "width": 3}
+
+
+def _gauge(
+    value: float,
+    title: str,
+    steps: tuple[dict, ...],
+    axis_max: int = 100,
+    mode: str = "gauge+number",
+    threshold: Optional[float] = None,
+    bar_color: str = COLORS["primary"],
+) -> dict:
+    """Traza indicator en porcentaje; solo valor, título, barra y umbral cambian entre gauges."""
+    gauge = {
+        "axis": {"range": [0, axis_max]},
+        "bar": {"color": bar_color},
+        "steps": steps,
+    }
+    if threshold is not None:
+        gauge["threshold"] = {"line": GAUGE_THRESHOLD_LINE, "thickness": 0.8, "value": threshold}
+    return _trace(
+        "indicator", mode=mode, value=value,
+        number={"suffix": "%"}, title={"text": title}, gauge=gauge,
+    )
+
+
+def _layout(
+    title: str,
+    height: int = 380,
+    x_title: str = "",
+    y_title: str = "",
+    **extra,
+) -> dict:
+    """Layout completo como dict plano sobre LAYOUT_BASE, listo para _figure(layout=...)."""
+    xaxis = dict(AXIS_BASE, title={"text": x_title}) if x_title else dict(AXIS_BASE)
+    yaxis = dict(AXIS_BASE, title={"text": y_title}) if y_title else dict(AXIS_BASE)
+    return {
+        **LAYOUT_BASE,
+        "title": {"text": title, "font": {"size": 16}},
+        "height": height,
+        "xaxis": xaxis,
+        "yaxis": yaxis,
+        **extra,
+    }
 
 
 # ── Ocupación: fecha específica ────────────────────────────────────────
 
-def chart_occupancy_date(data: dict) -> list[go.Figure]:
+def chart_occupancy_date(data: dict) -> list[Figure]:
     figures = []
 
-    # 1. Reservas por cancha — barras horizontales
+    # Una sola pasada por las canchas alimenta las barras (1) y el mapa de calor (3).
     courts = data.get("courts", {})
-    if courts:
-        names = list(courts.keys())
-        counts = [c["bookings_count"] for c in courts.values()]
+    names, counts, slot_hours = [], [], {}
+    for court, info in courts.items():
+        names.append(court)
+        counts.append(info["bookings_count"])
+        for slot in info.get("time_slots", []):
+            start_iso = slot.get("start_iso", "")
+            if "T" in start_iso:
+                slot_hours.setdefault(court, []).append(_hour(start_iso))
 
-        fig = go.Figure(go.Bar(
-            x=counts, y=names, orientation="h",
-            marker_color=COLORS["primary"],
+    # 1. Reservas por cancha — barras horizontales
+    if courts:
+        fig = _figure(_trace(
+            "bar", x=_ints(counts), y=names, orientation="h",
+            marker={"color": COLORS["primary"]},
             text=counts, textposition="auto",
-        ))
-        _apply_layout(fig, f"Reservas por Cancha — {data['date']}")
-        fig.update_xaxes(title_text="Reservas")
+        ), layout=_layout(f"Reservas por Cancha — {data['date']}", x_title="Reservas"))
         figures.append(fig)
 
     # 2. Indicador de ocupación
     pct = data.get("occupancy_percentage", 0)
-    fig = go.Figure(go.Indicator(
-        mode="gauge+number+delta",
-        value=pct,
-        number={"suffix": "%"},
-        title={"text": f"Ocupación de Canchas — {data['date']}"},
-        gauge={
-            "axis": {"range": [0, 100]},
-            "bar": {"color": COLORS["primary"]},
-            "steps": [
-                {"range": [0, 30], "color": "#e8f5e9"},
-                {"range": [30, 70], "color": "#fff9c4"},
-                {"range": [70, 100], "color": "#ffebee"},
-            ],
-            "threshold": {
-                "line": {"color": COLORS["accent"], "width": 3},
-                "thickness": 0.8,
-                "value": 85,
-            },
-        },
-    ))
-    _apply_layout(fig, f"Ocupación de Canchas — {data['date']}", height=300)
+    fig = _figure(_gauge(
+        pct, f"Ocupación de Canchas — {data['date']}", OCCUPANCY_STEPS,
+        mode="gauge+number+delta", threshold=85,
+    ), layout=_layout(f"Ocupación de Canchas — {data['date']}", height=300))
     figures.append(fig)
 
     # 3. Mapa de calor por cancha y hora
-    if courts:
-        court_names = []
-        hours = []
-        for court, info in courts.items():
-            for slot in info.get("time_slots", []):
-                start_iso = slot.get("start_iso", "")
-                if "T" in start_iso:
-                    h = int(start_iso.split("T")[1][:2])
-                    court_names.append(court)
-                    hours.append(h)
-
-        if court_names:
-            unique_courts = sorted(set(court_names))
-            all_hours = list(range(7, 24))
-            matrix = []
-            for c in unique_courts:
-                row = []
-                for h in all_hours:
-                    count = sum(1 for cn, hr in zip(court_names, hours) if cn == c and hr == h)
-                    row.append(count)
-                matrix.append(row)
-
-            fig = go.Figure(go.Heatmap(
-                z=matrix,
-                x=[f"{h:02d}:00" for h in all_hours],
-                y=unique_courts,
-                colorscale=[[0, "#f5f5f5"], [0.5, "#80cbc4"], [1, "#00695c"]],
-                showscale=True,
-                colorbar_title="Reservas",
-            ))
-            _apply_layout(fig, f"Mapa de Uso por Cancha — {data['date']}")
-            fig.update_xaxes(title_text="Hora")
-            figures.append(fig)
+    if slot_hours:
+        unique_courts = sorted(slot_hours)
+        # Cada reserva suma 1 a su celda (cancha, hora) aplanada.
+        cells = [
+            i * N_HOURS + (h - 7)
+            for i, court in enumerate(unique_courts)
+            for h in slot_hours[court]
+            if 7 <= h < 24
+        ]
+        matrix = np.bincount(
+            cells, minlength=len(unique_courts) * N_HOURS
+        ).reshape(len(unique_courts), N_HOURS)
+
+        fig = _figure(_trace(
+            "heatmap",
+            z=_ints(matrix),
+            x=HOUR_LABELS,
+            y=unique_courts,
+            colorscale=[[0, "#f5f5f5"], [0.5, "#80cbc4"], [1, "#00695c"]],
+            showscale=True,
+            colorbar={"title": {"text": "Reservas"}},
+        ), layout=_layout(f"Mapa de Uso por Cancha — {data['date']}", x_title="Hora"))
+        figures.append(fig)
 
     return figures
 
 
 # ── Ocupación: rango de fechas ─────────────────────────────────────────
 
-def chart_occupancy_range(data: dict) -> list[go.Figure]:
+def chart_occupancy_range(data: dict) -> list[Figure]:
     figures = []
 
     # 1. Reservas diarias — línea
     daily = data.get("daily_breakdown", {})
     if daily:
-        dates = list(daily.keys())
-        counts = list(daily.values())
+        dates, counts = _unzip(daily)
 
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=dates, y=counts, mode="lines+markers",
+        fig = _figure(_trace(
+            "scatter", x=dates, y=_ints(counts), mode="lines+markers",
             line=dict(color=COLORS["primary"], width=3),
             marker=dict(size=8),
             fill="tozeroy",
             fillcolor="rgba(27,153,139,0.15)",
+        ), layout=_layout(
+            f"Reservas Diarias — {data['period']}",
+            x_title="Fecha", y_title="Reservas",
         ))
-        _apply_layout(fig, f"Reservas Diarias — {data['period']}")
-        fig.update_xaxes(title_text="Fecha")
-        fig.update_yaxes(title_text="Reservas")
         figures.append(fig)
 
     # 2. Reservas por cancha — barras
     by_court = data.get("bookings_by_court", {})
     if by_court:
-        courts = list(by_court.keys())
-        vals = list(by_court.values())
+        courts, vals = _unzip(by_court)
 
-        fig = go.Figure(go.Bar(
-            x=courts, y=vals,
-            marker_color=PALETTE[:len(courts)],
+        fig = _figure(_trace(
+            "bar", x=courts, y=_ints(vals),
+            marker={"color": _palette(len(courts))},
             text=vals, textposition="auto",
-        ))
-        _apply_layout(fig, f"Reservas por Cancha — {data['period']}")
-        fig.update_yaxes(title_text="Reservas")
+        ), layout=_layout(f"Reservas por Cancha — {data['period']}", y_title="Reservas"))
         figures.append(fig)
 
     return figures
@@ -164,70 +261,73 @@ def chart_occupancy_range(data: dict) -> list[go.Figure]:
 
 # ── Ingresos ───────────────────────────────────────────────────────────
 
-def chart_revenue(data: dict) -> list[go.Figure]:
+def chart_revenue(data: dict) -> list[Figure]:
     figures = []
     currency = data.get("currency", "EUR")
 
     # 1. Ingresos diarios — barras
     daily = data.get("daily_revenue", {})
     if daily:
-        dates = list(daily.keys())
-        vals = list(daily.values())
+        dates, vals = _unzip(daily)
 
-        fig = go.Figure(go.Bar(
-            x=dates, y=vals,
-            marker_color=COLORS["primary"],
+        fig = _figure(_trace(
+            "bar", x=dates, y=_floats(vals),
+            marker={"color": COLORS["primary"]},
             text=[f"{v:.0f}" for v in vals],
             textposition="auto",
+        ), layout=_layout(
+            f"Ingresos Diarios ({currency}) — {data['period']}",
+            x_title="Fecha", y_title=f"Ingresos ({currency})",
         ))
-        _apply_layout(fig, f"Ingresos Diarios ({currency}) — {data['period']}")
-        fig.update_xaxes(title_text="Fecha")
-        fig.update_yaxes(title_text=f"Ingresos ({currency})")
         figures.append(fig)
 
     # 2. Ingresos por cancha — barras + línea
     by_court = data.get("by_court", {})
     if by_court:
-        courts = list(by_court.keys())
-        revenues = [v["revenue"] for v in by_court.values()]
-        booking_counts = [v["count"] for v in by_court.values()]
-
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            x=courts, y=revenues, name="Ingresos",
-            marker_color=COLORS["primary"],
-            text=[f"{r:.0f}" for r in revenues],
-            textposition="auto",
-        ))
-        fig.add_trace(go.Scatter(
-            x=courts, y=booking_counts, name="Reservas",
-            mode="lines+markers",
-            line=dict(color=COLORS["accent"], width=2),
-            marker=dict(size=8),
-            yaxis="y2",
-        ))
-        _apply_layout(fig, f"Ingresos y Reservas por Cancha — {data['period']}")
-        fig.update_layout(
-            yaxis=dict(title=f"Ingresos ({currency})"),
-            yaxis2=dict(title="Reservas", overlaying="y", side="right"),
-            legend=dict(orientation="h", yanchor="bottom", y=1.02),
+        courts, revenues, booking_counts = [], [], []
+        for court, v in by_court.items():
+            courts.append(court)
+            revenues.append(v["revenue"])
+            booking_counts.append(v["count"])
+
+        fig = _figure(
+            _trace(
+                "bar", x=courts, y=_floats(revenues), name="Ingresos",
+                marker={"color": COLORS["primary"]},
+                text=[f"{r:.0f}" for r in revenues],
+                textposition="auto",
+            ),
+            _trace(
+                "scatter", x=courts, y=_ints(booking_counts), name="Reservas",
+                mode="lines+markers",
+                line=dict(color=COLORS["accent"], width=2),
+                marker=dict(size=8),
+                yaxis="y2",
+            ),
+            layout=_layout(
+                f"Ingresos y Reservas por Cancha — {data['period']}",
+                y_title=f"Ingresos ({currency})",
+                yaxis2=dict(title={"text": "Reservas"}, overlaying="y", side="right"),
+                legend=dict(orientation="h", yanchor="bottom", y=1.02),
+            ),
         )
         figures.append(fig)
 
     # 3. Distribución por estado de pago — dona
     by_payment = data.get("by_payment_status", {})
     if by_payment:
-        labels = list(by_payment.keys())
-        values = [v["revenue"] for v in by_payment.values()]
+        labels, values = [], []
+        for status, v in by_payment.items():
+            labels.append(status)
+            values.append(v["revenue"])
 
-        fig = go.Figure(go.Pie(
-            labels=labels, values=values,
+        fig = _figure(_trace(
+            "pie", labels=labels, values=_floats(values),
             hole=0.5,
-            marker_colors=PALETTE[:len(labels)],
+            marker={"colors": _palette(len(labels))},
             textinfo="label+percent",
             textposition="outside",
-        ))
-        _apply_layout(fig, f"Ingresos por Estado de Pago — {data['period']}", height=350)
+        ), layout=_layout(f"Ingresos por Estado de Pago — {data['period']}", height=350))
         figures.append(fig)
 
     return figures
@@ -235,38 +335,37 @@ def chart_revenue(data: dict) -> list[go.Figure]:
 
 # ── Información de jugadores ───────────────────────────────────────────
 
-def chart_members(data: dict) -> list[go.Figure]:
+def chart_members(data: dict) -> list[Figure]:
     figures = []
 
     # 1. Jugadores que más reservan — barras horizontales
     top = data.get("top_bookers", [])
     if top:
-        names = [b["name"] for b in reversed(top)]
-        counts = [b["count"] for b in reversed(top)]
-
-        fig = go.Figure(go.Bar(
-            x=counts, y=names, orientation="h",
-            marker_color=COLORS["primary"],
+        names, counts = [], []
+        for b in reversed(top):
+            names.append(b["name"])
+            counts.append(b["count"])
+
+        fig = _figure(_trace(
+            "bar", x=_ints(counts), y=names, orientation="h",
+            marker={"color": COLORS["primary"]},
             text=counts, textposition="auto",
+        ), layout=_layout(
+            f"Jugadores con Más Reservas — {data['period']}", height=max(300, len(top) * 40 + 100),
+            x_title="Reservas",
         ))
-        _apply_layout(fig, f"Jugadores con Más Reservas — {data['period']}", height=max(300, len(top) * 40 + 100))
-        fig.update_xaxes(title_text="Reservas")
         figures.append(fig)
 
     # 2. Distribución de niveles — barras
     levels = data.get("padel_level_distribution", {})
     if levels:
-        lvl_labels = list(levels.keys())
-        lvl_counts = list(levels.values())
+        lvl_labels, lvl_counts = _unzip(levels)
 
-        fig = go.Figure(go.Bar(
-            x=lvl_labels, y=lvl_counts,
-            marker_color=COLORS["secondary"],
+        fig = _figure(_trace(
+            "bar", x=lvl_labels, y=_ints(lvl_counts),
+            marker={"color": COLORS["secondary"]},
             text=lvl_counts, textposition="auto",
-        ))
-        _apply_layout(fig, "Distribución de Niveles de Pádel")
-        fig.update_xaxes(title_text="Nivel")
-        fig.update_yaxes(title_text="Jugadores")
+        ), layout=_layout("Distribución de Niveles de Pádel", x_title="Nivel", y_title="Jugadores"))
         figures.append(fig)
 
     # 3. Jugadores activos vs registrados — indicador
@@ -274,22 +373,9 @@ def chart_members(data: dict) -> list[go.Figure]:
     active = data.get("active_players_in_period", 0)
     if total > 0:
         pct = round(active / total * 100, 1)
-        fig = go.Figure(go.Indicator(
-            mode="gauge+number",
-            value=pct,
-            number={"suffix": "%"},
-            title={"text": f"Jugadores Activos ({active}/{total})"},
-            gauge={
-                "axis": {"range": [0, 100]},
-                "bar": {"color": COLORS["primary"]},
-                "steps": [
-                    {"range": [0, 25], "color": "#ffebee"},
-                    {"range": [25, 60], "color": "#fff9c4"},
-                    {"range": [60, 100], "color": "#e8f5e9"},
-                ],
-            },
-        ))
-        _apply_layout(fig, f"Jugadores Activos ({active}/{total})", height=280)
+        fig = _figure(_gauge(
+            pct, f"Jugadores Activos ({active}/{total})", ACTIVE_PLAYERS_STEPS,
+        ), layout=_layout(f"Jugadores Activos ({active}/{total})", height=280))
         figures.append(fig)
 
     return figures
@@ -297,7 +383,7 @@ def chart_members(data: dict) -> list[go.Figure]:
 
 # ── Alertas operativas ─────────────────────────────────────────────────
 
-def chart_operations(data: dict) -> list[go.Figure]:
+def chart_operations(data: dict) -> list[Figure]:
     figures = []
 
     # 1. Reservas por hora — barras
@@ -312,81 +398,62 @@ def chart_operations(data: dict) -> list[go.Figure]:
         hours = [h[0] for h in sorted_h]
         counts = [h[1] for h in sorted_h]
 
-        peak_set = {h["hour"] for h in peak[:3]}
-        quiet_set = {h["hour"] for h in quiet[:2]} if quiet else set()
-        colors = [
-            COLORS["primary"] if h in peak_set
-            else COLORS["accent"] if h in quiet_set
-            else COLORS["muted"]
-            for h in hours
-        ]
+        # Pico se escribe después de valle para que tenga prioridad si coinciden.
+        hour_colors = {h["hour"]: COLORS["accent"] for h in quiet[:2]}
+        hour_colors.update((h["hour"], COLORS["primary"]) for h in peak[:3])
+        colors = [hour_colors.get(h, COLORS["muted"]) for h in hours]
 
-        fig = go.Figure(go.Bar(
-            x=hours, y=counts,
-            marker_color=colors,
+        fig = _figure(_trace(
+            "bar", x=hours, y=_ints(counts),
+            marker={"color": colors},
             text=counts, textposition="auto",
+        ), layout=_layout(
+            f"Reservas por Hora — {data['period']}",
+            x_title="Hora (hora local)", y_title="Reservas",
         ))
-        _apply_layout(fig, f"Reservas por Hora — {data['period']}")
-        fig.update_xaxes(title_text="Hora (hora local)")
-        fig.update_yaxes(title_text="Reservas")
         figures.append(fig)
 
     # 2. Distribución por día de la semana
     dow = data.get("day_of_week_distribution", {})
     if dow:
-        day_order = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-        ordered = [(d, dow.get(d, 0)) for d in day_order if d in dow]
-        days = [d[0][:3] for d in ordered]
-        vals = [d[1] for d in ordered]
-
-        fig = go.Figure(go.Bar(
-            x=days, y=vals,
-            marker_color=[COLORS["secondary"] if d[0] in ("Sábado", "Domingo") else COLORS["primary"] for d in ordered],
+        days, vals, day_colors = [], [], []
+        for d in DAY_ORDER:
+            v = dow.get(d)
+            if v is not None:
+                days.append(d[:3])
+                vals.append(v)
+                day_colors.append(COLORS["secondary"] if d in WEEKEND else COLORS["primary"])
+
+        fig = _figure(_trace(
+            "bar", x=days, y=_ints(vals),
+            marker={"color": day_colors},
             text=vals, textposition="auto",
-        ))
-        _apply_layout(fig, f"Reservas por Día de la Semana — {data['period']}")
-        fig.update_yaxes(title_text="Reservas")
+        ), layout=_layout(f"Reservas por Día de la Semana — {data['period']}", y_title="Reservas"))
         figures.append(fig)
 
     # 3. Tipos de reserva — dona
     types = data.get("booking_type_distribution", {})
     if types:
-        labels = [t.replace("_", " ").title() for t in types.keys()]
-        values = list(types.values())
+        type_keys, values = _unzip(types)
+        # str(): Playtomic puede mandar booking_type null.
+        labels = [str(t).replace("_", " ").title() for t in type_keys]
 
-        fig = go.Figure(go.Pie(
-            labels=labels, values=values,
+        fig = _figure(_trace(
+            "pie", labels=labels, values=_ints(values),
             hole=0.45,
-            marker_colors=PALETTE[:len(labels)],
+            marker={"colors": _palette(len(labels))},
             textinfo="label+percent",
             textposition="outside",
-        ))
-        _apply_layout(fig, f"Tipos de Reserva — {data['period']}", height=350)
+        ), layout=_layout(f"Tipos de Reserva — {data['period']}", height=350))
         figures.append(fig)
 
     # 4. Indicador de tasa de cancelación
     cancel_rate = data.get("cancellation_rate_pct", 0)
-    fig = go.Figure(go.Indicator(
-        mode="gauge+number",
-        value=cancel_rate,
-        number={"suffix": "%"},
-        title={"text": "Tasa de Cancelación"},
-        gauge={
-            "axis": {"range": [0, 50]},
-            "bar": {"color": COLORS["accent"] if cancel_rate > 15 else COLORS["primary"]},
-            "steps": [
-                {"range": [0, 10], "color": "#e8f5e9"},
-                {"range": [10, 20], "color": "#fff9c4"},
-                {"range": [20, 50], "color": "#ffebee"},
-            ],
-            "threshold": {
-                "line": {"color": COLORS["accent"], "width": 3},
-                "thickness": 0.8,
-                "value": 15,
-            },
-        },
-    ))
-    _apply_layout(fig, "Tasa de Cancelación", height=280)
+    fig = _figure(_gauge(
+        cancel_rate, "Tasa de Cancelación", CANCELLATION_STEPS,
+        axis_max=50, threshold=15,
+        bar_color=COLORS["accent"] if cancel_rate > 15 else COLORS["primary"],
+    ), layout=_layout("Tasa de Cancelación", height=280))
     figures.append(fig)
 
     return figures
@@ -394,7 +461,7 @@ def chart_operations(data: dict) -> list[go.Figure]:
 
 # ── Horarios disponibles ──────────────────────────────────────────────
 
-def chart_available_slots(data: dict) -> list[go.Figure]:
+def chart_available_slots(data: dict) -> list[Figure]:
     figures = []
 
     slots_by_court = data.get("slots_by_court", {})
@@ -402,51 +469,55 @@ def chart_available_slots(data: dict) -> list[go.Figure]:
         return figures
 
     # 1. Horarios disponibles por cancha
-    courts = list(slots_by_court.keys())
-    slot_counts = [len(s) for s in slots_by_court.values()]
-
-    fig = go.Figure(go.Bar(
-        x=courts, y=slot_counts,
-        marker_color=COLORS["success"],
+    courts, slot_counts = [], []
+    for court, slots in slots_by_court.items():
+        courts.append(court)
+        slot_counts.append(len(slots))
+
+    fig = _figure(_trace(
+        "bar", x=courts, y=_ints(slot_counts),
+        marker={"color": COLORS["success"]},
         text=slot_counts, textposition="auto",
+    ), layout=_layout(
+        f"Horarios Disponibles por Cancha — {data['date']}",
+        y_title="Horarios Libres",
     ))
-    _apply_layout(fig, f"Horarios Disponibles por Cancha — {data['date']}")
-    fig.update_yaxes(title_text="Horarios Libres")
     figures.append(fig)
 
     # 2. Mapa de disponibilidad
-    all_hours = list(range(7, 24))
     court_ids = sorted(slots_by_court.keys())
     matrix = []
     for cid in court_ids:
-        row = [0] * len(all_hours)
+        row = [0] * N_HOURS
         for s in slots_by_court[cid]:
             st = s.get("start_time", "")
             if st:
                 try:
-                    h = int(st.split(":")[0])
-                    if h in all_hours:
-                        row[all_hours.index(h)] = 1
+                    idx = int(st.partition(":")[0]) - 7
+                    if 0 <= idx < N_HOURS:
+                        row[idx] = 1
                 except (ValueError, IndexError):
                     pass
         matrix.append(row)
 
     if matrix:
-        fig = go.Figure(go.Heatmap(
-            z=matrix,
-            x=[f"{h:02d}:00" for h in all_hours],
-            y=[f"Cancha {i+1}" for i in range(len(court_ids))],
+        fig = _figure(_trace(
+            "heatmap",
+            z=_ints(matrix),
+            x=HOUR_LABELS,
+            y=_court_labels(len(court_ids)),
             colorscale=[[0, "#ffebee"], [1, "#c8e6c9"]],
             showscale=False,
             zmin=0, zmax=1,
+        ), layout=_layout(
+            f"Mapa de Disponibilidad — {data['date']}",
+            x_title="Hora",
+            annotations=[dict(
+                x=1.0, y=-0.15, xref="paper", yref="paper",
+                text="Verde = Disponible | Rojo = Reservado",
+                showarrow=False, font={"size": 11, "color": COLORS["muted"]},
+            )],
         ))
-        _apply_layout(fig, f"Mapa de Disponibilidad — {data['date']}")
-        fig.update_xaxes(title_text="Hora")
-        fig.add_annotation(
-            x=1.0, y=-0.15, xref="paper", yref="paper",
-            text="Verde = Disponible | Rojo = Reservado",
-            showarrow=False, font_size=11, font_color=COLORS["muted"],
-        )
         figures.append(fig)
 
     return figures
@@ -454,58 +525,51 @@ def chart_available_slots(data: dict) -> list[go.Figure]:
 
 # ── Detalles de reservas ──────────────────────────────────────────────
 
-def chart_booking_details(data: dict) -> list[go.Figure]:
+def chart_booking_details(data: dict) -> list[Figure]:
     figures = []
     bookings = data.get("bookings", [])
     if not bookings:
         return figures
 
-    courts = {}
+    court_names = sorted({b.get("court", "Desconocido") for b in bookings})
+    court_idx = {c: i for i, c in enumerate(court_names)}
+
+    # Una pasada guarda los jugadores de cada celda (cancha, hora); si dos reservas
+    # caen en la misma celda queda la última, como antes. Solo se unen los nombres
+    # de las celdas que sobreviven, y z y customdata se llenan con asignación indexada.
+    cell_players = {}
     for b in bookings:
-        court = b.get("court", "Desconocido")
-        courts.setdefault(court, [])
         start_iso = b.get("start_iso", "")
-        players = ", ".join(b.get("players", ["Desconocido"]))
         if "T" in start_iso:
-            h = int(start_iso.split("T")[1][:2])
-            m = int(start_iso.split("T")[1][3:5])
-            courts[court].append({"hour": h + m / 60, "players": players, "type": b.get("booking_type", "")})
+            idx = _hour(start_iso) - 7
+            if 0 <= idx < N_HOURS:
+                cell_players[court_idx[b.get("court", "Desconocido")], idx] = b.get("players", ["Desconocido"])
+
+    if court_names:
+        matrix = np.zeros((len(court_names), N_HOURS), dtype=np.int32)
+        hover_text = np.full(matrix.shape, "", dtype=object)
+        if cell_players:
+            rows, cols = zip(*cell_players)
+            matrix[rows, cols] = 1
+            hover_text[rows, cols] = np.array([", ".join(p) for p in cell_players.values()], dtype=object)
 
-    if courts:
-        all_hours = list(range(7, 24))
-        court_names = sorted(courts.keys())
-
-        matrix = []
-        hover_text = []
-        for c in court_names:
-            row = [0] * len(all_hours)
-            text_row = [""] * len(all_hours)
-            for entry in courts[c]:
-                h = int(entry["hour"])
-                if h in all_hours:
-                    idx = all_hours.index(h)
-                    row[idx] = 1
-                    text_row[idx] = entry["players"]
-            matrix.append(row)
-            hover_text.append(text_row)
-
-        fig = go.Figure(go.Heatmap(
-            z=matrix,
-            x=[f"{h:02d}:00" for h in all_hours],
-            y=court_names,
-            customdata=hover_text,
-            hovertemplate="<b>%{y}</b> a las %{x}<br>Jugadores: %{customdata}<extra></extra>",
-            colorscale=[[0, "#f5f5f5"], [1, "#1B998B"]],
-            showscale=False,
-        ))
         filters = data.get("filters_applied", {})
         title_parts = [f"Agenda de Reservas — {data['date']}"]
         if filters.get("court_name"):
             title_parts.append(f"(Cancha: {filters['court_name']})")
         if filters.get("player_name"):
             title_parts.append(f"(Jugador: {filters['player_name']})")
-        _apply_layout(fig, " ".join(title_parts))
-        fig.update_xaxes(title_text="Hora (hora local)")
+
+        fig = _figure(_trace(
+            "heatmap",
+            z=matrix,
+            x=HOUR_LABELS,
+            y=court_names,
+            customdata=hover_text,
+            hovertemplate="<b>%{y}</b> a las %{x}<br>Jugadores: %{customdata}<extra></extra>",
+            colorscale=[[0, "#f5f5f5"], [1, "#1B998B"]],
+            showscale=False,
+        ), layout=_layout(" ".join(title_parts), x_title="Hora (hora local)"))
         figures.append(fig)
 
     return figures
@@ -522,12 +586,60 @@ CHART_BUILDERS = {
 }
 
 
-def build_charts(tool_name: str, tool_result: dict) -> list[go.Figure]:
+# Clave que cada constructor lee siempre (títulos); sin ella el resultado es un error o un aviso.
+REQUIRED_KEYS = {
+    "get_occupancy_for_date": "date",
+    "get_occupancy_for_range": "period",
+    "get_revenue_summary": "period",
+    "get_member_insights": "period",
+    "get_operational_alerts": "period",
+    "get_available_slots": "date",
+    "get_booking_details": "date",
+}
+
+
+def build_charts(tool_name: str, tool_result: dict) -> list[Figure]:
     """Construye gráficos para un resultado de herramienta. Retorna lista vacía si no aplica."""
     builder = CHART_BUILDERS.get(tool_name)
-    if builder:
-        try:
-            return builder(tool_result)
-        except Exception:
-            return []
-    return []
+    if not builder or REQUIRED_KEYS[tool_name] not in tool_result:
+        return []
+    try:
+        return builder(tool_result)
+    except Exception:
+        # Un gráfico que falla nunca debe costar la respuesta ya mostrada: sin gráficos.
+        logger.exception("No se pudieron construir los gráficos de %s", tool_name)
+        return []
+
+
+_NO_SPECS: tuple[str, ...] = ()
+
+# JSON de figuras por resultado, con desalojo LRU. La clave es un digest del
+# resultado: la caché no retiene los payloads completos de las herramientas.
+_SPEC_CACHE: "OrderedDict[bytes, tuple[str, ...]]" = OrderedDict()
+_SPEC_CACHE_SIZE = 128
+_SPEC_CACHE_LOCK = threading.Lock()
+
+
+def build_chart_specs(tool_name: str, tool_result: dict) -> tuple[str, ...]:
+    """
+    Igual que build_charts, pero retorna el JSON de cada figura y lo memoiza
+    por el contenido del resultado: un mismo resultado no se vuelve a graficar.
+    """
+    if tool_name not in CHART_BUILDERS or REQUIRED_KEYS[tool_name] not in tool_result:
+        return _NO_SPECS
+    # Sin sort_keys: los constructores dependen del orden de inserción de los dicts.
+    payload = json.dumps(tool_result, default=str)
+    key = hashlib.blake2b(f"{tool_name}\0{payload}".encode(), digest_size=16).digest()
+
+    with _SPEC_CACHE_LOCK:
+        specs = _SPEC_CACHE.get(key)
+        if specs is not None:
+            _SPEC_CACHE.move_to_end(key)
+            return specs
+
+    specs = tuple(fig.to_json() for fig in build_charts(tool_name, tool_result))
+    with _SPEC_CACHE_LOCK:
+        _SPEC_CACHE[key] = specs
+        if len(_SPEC_CACHE) > _SPEC_CACHE_SIZE:
+            _SPEC_CACHE.popitem(last=False)
+    return specs
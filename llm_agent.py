@@ -5,64 +5,90 @@ Usa OpenAI GPT con function calling para responder preguntas en lenguaje
 natural sobre ocupación, ingresos, jugadores y operaciones del club.
 """
 
-import json
+import functools
+import heapq
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, date, timezone
-from typing import Optional
+from operator import itemgetter
+from typing import Iterator, Optional
 from zoneinfo import ZoneInfo
 
 import openai
+import orjson
 import pandas as pd
 
 from playtomic_api import PlaytomicAPI
 
 # ── Helpers de zona horaria ────────────────────────────────────────────
 
+def _fixed_utc_offset(tz: ZoneInfo) -> Optional[timedelta]:
+    """Offset constante de la zona si no cambia (sin horario de verano) en
+    ±1 año alrededor de hoy, que cubre los 90 días de histórico. None si cambia."""
+    now = datetime.now(timezone.utc)
+    offsets = {(now + timedelta(days=30 * m)).astimezone(tz).utcoffset() for m in range(-13, 14)}
+    return offsets.pop() if len(offsets) == 1 else None
+
+
 _club_tz: ZoneInfo = ZoneInfo("America/Cancun")
+_club_fixed_offset: Optional[timedelta] = _fixed_utc_offset(_club_tz)
 
 
 def set_club_timezone(tz_name: str):
     """Establece la zona horaria del club para todas las conversiones."""
-    global _club_tz
-    _club_tz = ZoneInfo(tz_name)
+    global _club_tz, _club_fixed_offset
+    if str(_club_tz) != tz_name:
+        _club_tz = ZoneInfo(tz_name)
+        _club_fixed_offset = _fixed_utc_offset(_club_tz)
+        _utc_to_local_dt.cache_clear()
 
 
+@functools.lru_cache(maxsize=16384)
 def _utc_to_local_dt(utc_str: str) -> Optional[datetime]:
-    """Convierte una cadena UTC a un datetime local con zona horaria."""
+    """Convierte una cadena UTC a un datetime local con zona horaria.
+
+    Memoizada: cada reserva pasa por aquí varias veces (inicio, fin, fecha,
+    hora) con las mismas cadenas. fromisoformat está en C, a diferencia de strptime.
+    Si la zona tiene offset fijo (Cancún), basta sumarlo en vez de astimezone.
+    """
     if not utc_str or "T" not in utc_str:
         return None
     try:
-        dt_utc = datetime.strptime(utc_str[:19], "%Y-%m-%dT%H:%M:%S").replace(
-            tzinfo=timezone.utc
-        )
-        return dt_utc.astimezone(_club_tz)
+        dt = datetime.fromisoformat(utc_str[:19])
+        if _club_fixed_offset is not None:
+            return (dt + _club_fixed_offset).replace(tzinfo=_club_tz)
+        return dt.replace(tzinfo=timezone.utc).astimezone(_club_tz)
     except (ValueError, IndexError):
         return None
 
 
-def _utc_to_local(utc_str: str) -> str:
-    """Convierte una cadena UTC (YYYY-MM-DDTHH:MM:SS) a ISO local."""
-    dt = _utc_to_local_dt(utc_str)
-    return dt.strftime("%Y-%m-%dT%H:%M:%S") if dt else utc_str
-
-
 def _utc_to_local_date(utc_str: str) -> str:
     """Convierte una cadena UTC a fecha local (YYYY-MM-DD)."""
     dt = _utc_to_local_dt(utc_str)
     return dt.strftime("%Y-%m-%d") if dt else utc_str[:10] if utc_str else ""
 
 
-def _utc_to_readable_time(utc_str: str) -> str:
-    """Convierte UTC a hora local legible como '7:00 PM'."""
-    dt = _utc_to_local_dt(utc_str)
-    if not dt:
-        return utc_str
-    return dt.strftime("%-I:%M %p")
+def _readable_time(dt: datetime) -> str:
+    """Hora legible como '7:00 PM'."""
+    # Equivale a strftime("%-I:%M %p"), pero sin el "%-I" exclusivo de glibc/BSD.
+    return f"{dt.hour % 12 or 12}:{dt.minute:02d} {'AM' if dt.hour < 12 else 'PM'}"
 
 
-def _utc_to_local_hour(utc_str: str) -> int:
-    """Convierte UTC a hora local (0-23) para agregación."""
-    dt = _utc_to_local_dt(utc_str)
-    return dt.hour if dt else 0
+def _booking_times(booking: dict) -> tuple[str, str]:
+    """
+    Rango legible ('7:00 PM - 8:30 PM') e ISO local de inicio de una reserva.
+    Cada extremo se convierte una sola vez; si no se puede, se deja la cadena UTC.
+    """
+    start_utc = booking.get("booking_start_date", "")
+    end_utc = booking.get("booking_end_date", "")
+    start = _utc_to_local_dt(start_utc)
+    end = _utc_to_local_dt(end_utc)
+    start_readable = _readable_time(start) if start else start_utc
+    end_readable = _readable_time(end) if end else end_utc
+    start_iso = start.strftime("%Y-%m-%dT%H:%M:%S") if start else start_utc
+    return f"{start_readable} - {end_readable}", start_iso
 
 
 # ── Definiciones de herramientas para OpenAI function calling ─────────
@@ -256,9 +282,29 @@ TOOLS = [
 
 # ── Funciones de ejecución de herramientas ─────────────────────────────
 
+# Hilos para lecturas secundarias (disponibilidad, jugadores) que se solapan con
+# la lectura de reservas de la misma herramienta. Es un pool aparte del de
+# herramientas para que una herramienta nunca espere a una tarea encolada detrás
+# de ella misma.
+_side_fetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="fetch")
+
+
+def _optional_fetch(fn, *args) -> Future:
+    """Lanza una lectura opcional en segundo plano; si falla, su resultado es []."""
+    def run():
+        try:
+            return fn(*args)
+        except Exception:
+            return []
+    return _side_fetch_pool.submit(run)
+
 
+@functools.lru_cache(maxsize=256)
 def _parse_price(price_str: str) -> float:
-    """Parsea un string de precio como '10 EUR' a float."""
+    """Parsea un string de precio como '10 EUR' a float.
+
+    Memoizada: un club maneja pocas tarifas distintas y se repiten en cada reserva.
+    """
     if not price_str:
         return 0.0
     try:
@@ -283,32 +329,45 @@ def _extract_participants(booking: dict) -> list[str]:
     return names if names else ["Desconocido"]
 
 
+def _participants_with_details(booking: dict) -> tuple[list[str], list[dict]]:
+    """Nombres (como _extract_participants) y detalle de cada participante en una sola pasada."""
+    names = []
+    details = []
+    for p in booking.get("participant_info", {}).get("participants", []):
+        if "name" in p:
+            name = p["name"].strip()
+            if name:
+                names.append(name)
+        else:
+            name = "Desconocido"
+        detail = {"name": name}
+        if p.get("email"):
+            detail["email"] = p["email"]
+        detail["type"] = p.get("participant_type", "UNKNOWN")
+        details.append(detail)
+    return names or ["Desconocido"], details
+
+
 def execute_get_occupancy_for_date(
     api: PlaytomicAPI, tenant_id: str, date_str: str
 ) -> dict:
     """Obtiene ocupación para una fecha específica."""
     target = datetime.strptime(date_str, "%Y-%m-%d")
 
+    availability_future = _optional_fetch(api.get_availability, tenant_id, target)
     bookings = api.get_bookings_for_date(tenant_id, target)
-    availability = []
-    try:
-        availability = api.get_availability(tenant_id, target)
-    except Exception:
-        pass
+    availability = availability_future.result()
 
     # Analizar reservas por cancha
-    courts = {}
+    courts = defaultdict(list)
+    total_booked = 0
     for b in bookings:
         if b.get("is_canceled"):
             continue
-        court = b.get("resource_name", "Desconocido")
-        if court not in courts:
-            courts[court] = []
-        start_readable = _utc_to_readable_time(b.get("booking_start_date", ""))
-        end_readable = _utc_to_readable_time(b.get("booking_end_date", ""))
-        start_iso = _utc_to_local(b.get("booking_start_date", ""))
-        courts[court].append({
-            "time": f"{start_readable} - {end_readable}",
+        total_booked += 1
+        time_range, start_iso = _booking_times(b)
+        courts[b.get("resource_name", "Desconocido")].append({
+            "time": time_range,
             "start_iso": start_iso,
             "players": _extract_participants(b),
             "type": b.get("booking_type", "UNKNOWN"),
@@ -317,8 +376,6 @@ def execute_get_occupancy_for_date(
             "price": b.get("price", "0"),
         })
 
-    active_bookings = [b for b in bookings if not b.get("is_canceled")]
-
     available_slots = {}
     for resource in availability:
         resource_id = resource.get("resource_id", "Desconocido")
@@ -329,7 +386,6 @@ def execute_get_occupancy_for_date(
         ]
 
     total_available = sum(len(s) for s in available_slots.values())
-    total_booked = len(active_bookings)
 
     occupancy_pct = 0
     if total_booked + total_available > 0:
@@ -367,25 +423,16 @@ def execute_get_occupancy_for_range(
     )
 
     active = [b for b in bookings if not b.get("is_canceled")]
-    canceled = [b for b in bookings if b.get("is_canceled")]
-
-    daily = {}
-    for b in active:
-        bdate = _utc_to_local_date(b.get("booking_start_date", ""))
-        daily.setdefault(bdate, 0)
-        daily[bdate] += 1
+    canceled_count = len(bookings) - len(active)
 
-    by_court = {}
-    for b in active:
-        court = b.get("resource_name", "Desconocido")
-        by_court.setdefault(court, 0)
-        by_court[court] += 1
+    daily = Counter(_utc_to_local_date(b.get("booking_start_date", "")) for b in active)
+    by_court = dict(Counter(b.get("resource_name", "Desconocido") for b in active))
 
     return {
         "period": f"{start_str} to {end_str}",
         "timezone": str(_club_tz),
         "total_bookings": len(active),
-        "total_canceled": len(canceled),
+        "total_canceled": canceled_count,
         "daily_breakdown": dict(sorted(daily.items())),
         "bookings_by_court": by_court,
         "busiest_day": max(daily, key=daily.get) if daily else "N/A",
@@ -408,28 +455,28 @@ def execute_get_revenue_summary(
 
     active = [b for b in bookings if not b.get("is_canceled")]
 
-    total_revenue = sum(_parse_price(b.get("price", "0")) for b in active)
-    avg_value = total_revenue / len(active) if active else 0
-
-    by_payment = {}
+    # Una sola pasada: el precio se parsea una vez por reserva y alimenta
+    # el total y los tres desgloses.
+    total_revenue = 0
+    by_payment = defaultdict(lambda: {"count": 0, "revenue": 0})
+    by_court = defaultdict(lambda: {"count": 0, "revenue": 0})
+    by_date = defaultdict(int)
     for b in active:
-        ps = b.get("payment_status", "UNKNOWN")
-        by_payment.setdefault(ps, {"count": 0, "revenue": 0})
-        by_payment[ps]["count"] += 1
-        by_payment[ps]["revenue"] += _parse_price(b.get("price", "0"))
+        price = _parse_price(b.get("price", "0"))
+        total_revenue += price
 
-    by_court = {}
-    for b in active:
-        court = b.get("resource_name", "Desconocido")
-        by_court.setdefault(court, {"count": 0, "revenue": 0})
-        by_court[court]["count"] += 1
-        by_court[court]["revenue"] += _parse_price(b.get("price", "0"))
+        pay = by_payment[b.get("payment_status", "UNKNOWN")]
+        pay["count"] += 1
+        pay["revenue"] += price
+
+        court = by_court[b.get("resource_name", "Desconocido")]
+        court["count"] += 1
+        court["revenue"] += price
 
-    by_date = {}
-    for b in active:
         bdate = _utc_to_local_date(b.get("booking_start_date", ""))
-        by_date.setdefault(bdate, 0)
-        by_date[bdate] += _parse_price(b.get("price", "0"))
+        by_date[bdate] += price
+
+    avg_value = total_revenue / len(active) if active else 0
 
     for k in by_payment:
         by_payment[k]["revenue"] = round(by_payment[k]["revenue"], 2)
@@ -442,8 +489,8 @@ def execute_get_revenue_summary(
         "total_revenue": round(total_revenue, 2),
         "total_bookings": len(active),
         "average_booking_value": round(avg_value, 2),
-        "by_payment_status": by_payment,
-        "by_court": by_court,
+        "by_payment_status": dict(by_payment),
+        "by_court": dict(by_court),
         "daily_revenue": by_date,
         "currency": "EUR",
     }
@@ -456,40 +503,33 @@ def execute_get_member_insights(
     start = datetime.strptime(start_str, "%Y-%m-%d")
     end = datetime.strptime(end_str, "%Y-%m-%d")
 
-    players = []
-    try:
-        players = api.get_players(tenant_id)
-    except Exception as e:
-        players = []
-
+    players_future = _optional_fetch(api.get_players, tenant_id)
     bookings = api.get_bookings_for_range(
         tenant_id,
         start.replace(hour=0, minute=0, second=0),
         end.replace(hour=23, minute=59, second=59),
     )
+    players = players_future.result()
     active = [b for b in bookings if not b.get("is_canceled")]
 
     player_bookings = {}
     for b in active:
-        participants = b.get("participant_info", {}).get("participants", [])
-        for p in participants:
+        for p in b.get("participant_info", {}).get("participants", []):
             pid = p.get("participant_id", "unknown")
-            name = p.get("name", "Desconocido")
-            player_bookings.setdefault(pid, {"name": name, "count": 0})
-            player_bookings[pid]["count"] += 1
+            entry = player_bookings.get(pid)
+            if entry is None:
+                # Solo se crea el dict del jugador la primera vez que aparece.
+                entry = player_bookings[pid] = {"name": p.get("name", "Desconocido"), "count": 0}
+            entry["count"] += 1
 
-    top_bookers = sorted(
-        player_bookings.values(), key=lambda x: x["count"], reverse=True
-    )[:10]
+    # Igual que sorted(..., reverse=True)[:10], sin ordenar a todos los jugadores.
+    top_bookers = heapq.nlargest(10, player_bookings.values(), key=lambda x: x["count"])
 
-    levels = {}
+    levels = Counter()
     for p in players:
         for sport in p.get("sports", []):
             if sport.get("sport_id") == "PADEL":
-                level = sport.get("level_value", 0)
-                bucket = f"{level:.1f}"
-                levels.setdefault(bucket, 0)
-                levels[bucket] += 1
+                levels[f"{sport.get('level_value', 0):.1f}"] += 1
 
     return {
         "period": f"{start_str} to {end_str}",
@@ -517,66 +557,58 @@ def execute_get_operational_alerts(
         end.replace(hour=23, minute=59, second=59),
     )
 
-    active = [b for b in bookings if not b.get("is_canceled")]
-    canceled = [b for b in bookings if b.get("is_canceled")]
+    # Una sola pasada: cancelaciones, hora, tipo, día de la semana y pagos
+    # pendientes. La fecha de inicio se convierte una vez por reserva.
+    canceled_count = 0
+    hour_counts = Counter()
+    type_dist = Counter()
+    dow_counts = Counter()
+    unpaid_count = 0
+    unpaid_revenue = 0.0
+    day_names = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+    for b in bookings:
+        if b.get("is_canceled"):
+            canceled_count += 1
+            continue
+
+        dt = _utc_to_local_dt(b.get("booking_start_date", ""))
+        hour_counts[dt.hour if dt else 0] += 1
+        type_dist[b.get("booking_type", "UNKNOWN")] += 1
+        if dt:
+            dow_counts[day_names[dt.weekday()]] += 1
+
+        if b.get("payment_status") in ("UNPAID", "PENDING"):
+            unpaid_count += 1
+            unpaid_revenue += _parse_price(b.get("price", "0"))
 
+    active_count = len(bookings) - canceled_count
     cancellation_rate = (
-        round(len(canceled) / len(bookings) * 100, 1) if bookings else 0
+        round(canceled_count / len(bookings) * 100, 1) if bookings else 0
     )
 
-    hour_counts = {}
-    for b in active:
-        hour = _utc_to_local_hour(b.get("booking_start_date", ""))
-        hour_counts.setdefault(hour, 0)
-        hour_counts[hour] += 1
-
-    sorted_hours = sorted(hour_counts.items(), key=lambda x: x[1], reverse=True)
+    sorted_hours = hour_counts.most_common()
     peak_hours = [{"hour": f"{h:02d}:00", "bookings": c} for h, c in sorted_hours[:5]]
     quiet_hours = [{"hour": f"{h:02d}:00", "bookings": c} for h, c in sorted_hours[-5:]] if len(sorted_hours) >= 5 else []
 
-    type_dist = {}
-    for b in active:
-        bt = b.get("booking_type", "UNKNOWN")
-        type_dist.setdefault(bt, 0)
-        type_dist[bt] += 1
-
-    dow_counts = {}
-    day_names = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-    for b in active:
-        bdate_str = _utc_to_local_date(b.get("booking_start_date", ""))
-        try:
-            bdate = datetime.strptime(bdate_str, "%Y-%m-%d")
-            day = day_names[bdate.weekday()]
-            dow_counts.setdefault(day, 0)
-            dow_counts[day] += 1
-        except ValueError:
-            pass
-
-    unpaid = [
-        b for b in active
-        if b.get("payment_status") in ("UNPAID", "PENDING")
-    ]
-    unpaid_revenue = sum(_parse_price(b.get("price", "0")) for b in unpaid)
-
     alerts = []
     if cancellation_rate > 15:
         alerts.append(f"Alta tasa de cancelación: {cancellation_rate}% (supera el umbral del 15%)")
     if unpaid_revenue > 0:
-        alerts.append(f"Ingresos sin cobrar/pendientes: {round(unpaid_revenue, 2)} EUR en {len(unpaid)} reservas")
+        alerts.append(f"Ingresos sin cobrar/pendientes: {round(unpaid_revenue, 2)} EUR en {unpaid_count} reservas")
     if quiet_hours:
         quietest = quiet_hours[0]["hour"]
         alerts.append(f"Horario más subutilizado: {quietest}")
 
     return {
         "period": f"{start_str} to {end_str}",
-        "total_bookings": len(active),
-        "total_canceled": len(canceled),
+        "total_bookings": active_count,
+        "total_canceled": canceled_count,
         "cancellation_rate_pct": cancellation_rate,
         "peak_hours": peak_hours,
         "quiet_hours": quiet_hours,
-        "booking_type_distribution": type_dist,
-        "day_of_week_distribution": dow_counts,
-        "unpaid_bookings": len(unpaid),
+        "booking_type_distribution": dict(type_dist),
+        "day_of_week_distribution": dict(dow_counts),
+        "unpaid_bookings": unpaid_count,
         "unpaid_revenue_eur": round(unpaid_revenue, 2),
         "alerts": alerts,
     }
@@ -625,36 +657,28 @@ def execute_get_booking_details(
     target = datetime.strptime(date_str, "%Y-%m-%d")
     bookings = api.get_bookings_for_date(tenant_id, target)
 
+    # Filtros normalizados una sola vez; se aplican antes de formatear horarios.
+    court_filter = court_name.casefold() if court_name else None
+    player_filter = player_name.casefold() if player_name else None
+
     results = []
     for b in bookings:
         if b.get("is_canceled") and not include_canceled:
             continue
 
         resource = b.get("resource_name", "Desconocido")
-        players = _extract_participants(b)
-        start_readable = _utc_to_readable_time(b.get("booking_start_date", ""))
-        end_readable = _utc_to_readable_time(b.get("booking_end_date", ""))
-        start_iso = _utc_to_local(b.get("booking_start_date", ""))
-
-        if court_name and court_name.lower() not in resource.lower():
+        if court_filter and court_filter not in resource.casefold():
             continue
 
-        if player_name:
-            match = any(player_name.lower() in p.lower() for p in players)
-            if not match:
-                continue
+        players, participant_details = _participants_with_details(b)
+        if player_filter and not any(player_filter in p.casefold() for p in players):
+            continue
 
-        participant_details = []
-        for p in b.get("participant_info", {}).get("participants", []):
-            detail = {"name": p.get("name", "Desconocido").strip()}
-            if p.get("email"):
-                detail["email"] = p["email"]
-            detail["type"] = p.get("participant_type", "UNKNOWN")
-            participant_details.append(detail)
+        time_range, start_iso = _booking_times(b)
 
         results.append({
             "court": resource,
-            "time": f"{start_readable} - {end_readable}",
+            "time": time_range,
             "start_iso": start_iso,
             "players": players,
             "participant_details": participant_details,
@@ -666,7 +690,7 @@ def execute_get_booking_details(
             "origin": b.get("origin", "UNKNOWN"),
         })
 
-    results.sort(key=lambda x: (x["court"], x["start_iso"]))
+    results.sort(key=itemgetter("court", "start_iso"))
 
     return {
         "date": date_str,
@@ -714,6 +738,12 @@ TOOL_EXECUTORS = {
 
 def build_system_prompt(tenant_id: str, timezone_name: str = "America/Cancun") -> str:
     today = datetime.now(ZoneInfo(timezone_name)).date()
+    return _system_prompt_for(tenant_id, timezone_name, today)
+
+
+@functools.lru_cache(maxsize=32)
+def _system_prompt_for(tenant_id: str, timezone_name: str, today: date) -> str:
+    """El prompt solo depende del club y del día local: se arma una vez por día."""
     return f"""Eres UtopIA, el asistente inteligente de Utopia Padel Cancún.
 Ayudas al administrador del club a responder preguntas sobre las operaciones usando datos en tiempo real de Playtomic.
 SIEMPRE responde en español.
@@ -736,6 +766,9 @@ Tus capacidades:
 Cuando el usuario pregunte sobre jugadores específicos o quién usó una cancha, usa la herramienta get_booking_details.
 Esta herramienta soporta filtros por nombre de cancha (ej: "Hirostar", "Pista 4") y nombre de jugador.
 
+Si necesitas varias herramientas para responder (ej: ocupación + ingresos + alertas para un resumen),
+solicítalas TODAS en la misma respuesta en lugar de una por una; se ejecutan en paralelo.
+
 Cuando el usuario pregunte sobre fechas:
 - "mañana" = {(today + timedelta(days=1)).isoformat()}
 - "la próxima semana" = {(today + timedelta(days=(7 - today.weekday()))).isoformat()} a {(today + timedelta(days=(13 - today.weekday()))).isoformat()}
@@ -775,6 +808,133 @@ Importante:
 
 # ── Clase principal del agente ─────────────────────────────────────────
 
+MAX_ITERATIONS = 5
+MAX_HISTORY_TURNS = 10  # turnos (pregunta + respuesta + herramientas), el actual incluido, que se reenvían al modelo
+MAX_TOOL_WORKERS = 8
+# El SDK de OpenAI ya reintenta 429, 5xx, timeouts y errores de conexión con
+# backoff exponencial y jitter (respetando Retry-After); subimos de 2 a 4 intentos.
+OPENAI_MAX_RETRIES = 4
+FALLBACK_RESPONSE = "Disculpa, no pude completar el análisis. Por favor intenta reformular tu pregunta."
+
+# Hilos para las herramientas de una ronda, compartidos por todos los agentes
+# del proceso: no se crean ni destruyen hilos en cada ronda.
+_tool_pool = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix="tools")
+
+# Mensajes triviales que se responden sin llamar al modelo. La clave es el
+# mensaje normalizado (minúsculas, sin signos ni espacios extra).
+_GREETING_REPLY = (
+    "¡Hola! Soy UtopIA. Puedo consultar ocupación, ingresos, jugadores, "
+    "horarios disponibles, reservas y alertas operativas del club. ¿Qué quieres revisar?"
+)
+_THANKS_REPLY = "¡Con gusto! Si necesitas revisar algo más del club, aquí estoy."
+_GOODBYE_REPLY = "¡Hasta luego! Aquí estaré cuando necesites revisar el club."
+_TRIVIAL_REPLIES = {
+    **dict.fromkeys(
+        ("hola", "buenas", "buenos días", "buenos dias", "buenas tardes", "buenas noches",
+         "hey", "hi", "hello", "ayuda", "help"),
+        _GREETING_REPLY,
+    ),
+    **dict.fromkeys(
+        ("gracias", "muchas gracias", "mil gracias", "ok gracias", "perfecto gracias", "thanks"),
+        _THANKS_REPLY,
+    ),
+    **dict.fromkeys(("adiós", "adios", "hasta luego", "chao", "bye"), _GOODBYE_REPLY),
+}
+
+
+def _trivial_reply(user_message: str) -> Optional[str]:
+    """Respuesta fija si el mensaje es solo un saludo, agradecimiento o despedida."""
+    normalized = " ".join(user_message.casefold().replace(",", " ").split()).strip("¡!¿?. ")
+    return _TRIVIAL_REPLIES.get(normalized)
+
+
+# Caché de resultados de herramientas compartido entre sesiones:
+# (herramienta, tenant, args normalizados) -> (expira_en, resultado, contenido para el modelo).
+# Las consultas que terminan antes de hoy viven más: esos días ya casi no cambian.
+TOOL_CACHE_TTL = 60  # segundos
+TOOL_CACHE_TTL_PAST = 900  # segundos
+TOOL_CACHE_SIZE = 256
+_tool_cache: dict[tuple[str, str, bytes], tuple[float, dict, str]] = {}
+_tool_cache_lock = threading.Lock()
+
+
+def _tool_cache_ttl(fn_args: dict) -> int:
+    last_day = fn_args.get("end_date") or fn_args.get("date")
+    today = datetime.now(_club_tz).date().isoformat()
+    return TOOL_CACHE_TTL_PAST if last_day and last_day < today else TOOL_CACHE_TTL
+
+
+# Caché de lecturas a Playtomic compartido entre turnos y sesiones:
+# (método, *args) -> (expira_en, datos). Cubre preguntas seguidas sobre el mismo
+# rango con herramientas distintas (ocupación y luego ingresos de "esta semana").
+# Pocas entradas: una lectura de 90 días puede traer miles de reservas.
+READ_CACHE_SIZE = 16
+_read_cache: dict[tuple, tuple[float, list]] = {}
+_read_cache_lock = threading.Lock()
+
+
+def _cached_read(api: PlaytomicAPI, method: str, args: tuple) -> list:
+    key = (method, *args)
+    now = time.monotonic()
+    with _read_cache_lock:
+        hit = _read_cache.get(key)
+    if hit and hit[0] > now:
+        return hit[1]
+
+    data = getattr(api, method)(*args)
+    days = [a for a in args if isinstance(a, datetime)]
+    last_day = max(days).date().isoformat() if days else None
+    ttl = _tool_cache_ttl({"date": last_day})
+    with _read_cache_lock:
+        _read_cache[key] = (now + ttl, data)
+        if len(_read_cache) > READ_CACHE_SIZE:
+            _read_cache.pop(next(iter(_read_cache)), None)
+    return data
+
+
+class _TurnFetches:
+    """
+    Envoltorio de PlaytomicAPI que vive un turno del agente: cada lectura con
+    los mismos argumentos va a Playtomic una sola vez, aunque la pidan varias
+    herramientas en paralelo (p. ej. ocupación e ingresos del mismo rango), y
+    se sirve desde _cached_read si un turno reciente ya la hizo.
+    Los demás atributos se delegan a la API real.
+    """
+
+    def __init__(self, api: PlaytomicAPI):
+        self._api = api
+        self._lock = threading.Lock()
+        self._fetches: dict[tuple, Future] = {}
+
+    def _once(self, method: str, *args):
+        key = (method, *args)
+        with self._lock:
+            fut = self._fetches.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._fetches[key] = Future()
+        if owner:
+            try:
+                fut.set_result(_cached_read(self._api, method, args))
+            except Exception as e:
+                fut.set_exception(e)
+        return fut.result()
+
+    def get_bookings_for_date(self, tenant_id: str, day: datetime) -> list[dict]:
+        return self._once("get_bookings_for_date", tenant_id, day)
+
+    def get_bookings_for_range(self, tenant_id: str, start: datetime, end: datetime) -> list[dict]:
+        return self._once("get_bookings_for_range", tenant_id, start, end)
+
+    def get_availability(self, tenant_id: str, day: datetime) -> list[dict]:
+        return self._once("get_availability", tenant_id, day)
+
+    def get_players(self, tenant_id: str) -> list[dict]:
+        return self._once("get_players", tenant_id)
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
 
 class PlaytomicAgent:
     """Agente conversacional UtopIA para gestión de Utopia Padel Cancún."""
@@ -786,14 +946,23 @@ class PlaytomicAgent:
         openai_api_key: str,
         model: str = "gpt-4o",
         timezone_name: str = "America/Cancun",
+        client: Optional[openai.OpenAI] = None,
     ):
         self.api = api
+        self._turn_api = _TurnFetches(api)
         self.tenant_id = tenant_id
-        self.client = openai.OpenAI(api_key=openai_api_key)
+        self.client = client or openai.OpenAI(api_key=openai_api_key, max_retries=OPENAI_MAX_RETRIES)
         self.model = model
         self.timezone_name = timezone_name
         set_club_timezone(timezone_name)
         self.messages: list[dict] = []
+        self.last_chart_data: list[tuple[str, dict]] = []
+        # Estado del último turno, para quien quiera reutilizar la respuesta:
+        # last_turn_ok es False si alguna herramienta falló o se agotaron las
+        # rondas; last_turn_ttl es el TTL más corto de los datos consultados
+        # (None si el turno no consultó datos).
+        self.last_turn_ok = True
+        self.last_turn_ttl: Optional[int] = None
         self._refresh_system_prompt()
 
     def _refresh_system_prompt(self):
@@ -804,11 +973,28 @@ class PlaytomicAgent:
         else:
             self.messages = [{"role": "system", "content": self.system_prompt}]
 
+    def _trim_history(self):
+        """
+        Conserva el system prompt y los últimos MAX_HISTORY_TURNS turnos, contando
+        el mensaje de usuario recién añadido. Corta siempre en un mensaje de
+        usuario para no separar una llamada a herramienta de su respuesta.
+        """
+        user_idx = [i for i, m in enumerate(self.messages) if m["role"] == "user"]
+        if len(user_idx) > MAX_HISTORY_TURNS:
+            del self.messages[1:user_idx[-MAX_HISTORY_TURNS]]
+
     def reset_conversation(self):
         """Limpia el historial de conversación, manteniendo el prompt del sistema."""
         self._refresh_system_prompt()
         self.messages = [{"role": "system", "content": self.system_prompt}]
 
+    def record_exchange(self, user_message: str, response: str):
+        """Añade al historial un turno ya respondido (p. ej. desde caché) sin llamar al modelo."""
+        self._refresh_system_prompt()
+        self.messages.append({"role": "user", "content": user_message})
+        self._trim_history()
+        self.messages.append({"role": "assistant", "content": response})
+
     def chat(self, user_message: str) -> tuple[str, list[tuple[str, dict]]]:
         """
         Envía un mensaje del usuario y obtiene una respuesta.
@@ -819,44 +1005,208 @@ class PlaytomicAgent:
 
             tuplas (nombre_herramienta, resultado_dict) para renderizar gráficos.
         """
+        self.last_turn_ok = True
+        self.last_turn_ttl = None
+        reply = _trivial_reply(user_message)
+        if reply:
+            self.record_exchange(user_message, reply)
+            return reply, []
+
         self._refresh_system_prompt()
         self.messages.append({"role": "user", "content": user_message})
+        self._trim_history()
+        self._turn_api = _TurnFetches(self.api)
         chart_data: list[tuple[str, dict]] = []
 
-        max_iterations = 5
-        for _ in range(max_iterations):
+        for _ in range(MAX_ITERATIONS):
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=self.messages,
                 tools=TOOLS,
                 tool_choice="auto",
+                parallel_tool_calls=True,
+                # Misma clave por club: las rondas comparten el prefijo (tools + system) en caché.
+                extra_body={"prompt_cache_key": f"utopia-{self.tenant_id}"},
             )
 
             message = response.choices[0].message
-            self.messages.append(message.model_dump())
+            # Solo los campos que la API necesita de vuelta, sin pasar por model_dump().
+            assistant = {"role": "assistant", "content": message.content}
+            if message.tool_calls:
+                assistant["tool_calls"] = [
+                    {
+                        "id": tc.id,
+                        "type": "function",
+                        "function": {"name": tc.function.name, "arguments": tc.function.arguments},
+                    }
+                    for tc in message.tool_calls
+                ]
+            self.messages.append(assistant)
 
             if not message.tool_calls:
                 return message.content or "", chart_data
 
-            for tool_call in message.tool_calls:
-                fn_name = tool_call.function.name
-                fn_args = json.loads(tool_call.function.arguments)
-
-                executor = TOOL_EXECUTORS.get(fn_name)
-                if executor:
-                    try:
-                        result = executor(self.api, self.tenant_id, fn_args)
-                        result_str = json.dumps(result, indent=2, default=str)
-                        chart_data.append((fn_name, result))
-                    except Exception as e:
-                        result_str = json.dumps({"error": str(e)})
-                else:
-                    result_str = json.dumps({"error": f"Herramienta desconocida: {fn_name}"})
-
-                self.messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": result_str,
-                })
-
-        return "Disculpa, no pude completar el análisis. Por favor intenta reformular tu pregunta.", chart_data
+            self._run_tool_calls(
+                [(tc.id, tc.function.name, tc.function.arguments) for tc in message.tool_calls],
+                chart_data,
+            )
+
+        self.last_turn_ok = False
+        return FALLBACK_RESPONSE, chart_data
+
+    def stream_chat(self, user_message: str) -> Iterator[str]:
+        """
+        Igual que chat(), pero transmite el texto de la respuesta final a medida
+        que el modelo lo genera. Las llamadas a herramientas intermedias se
+        acumulan desde los deltas y se ejecutan antes de la siguiente ronda.
+
+        Al agotar el generador, self.last_chart_data contiene las tuplas
+        (nombre_herramienta, resultado_dict) para renderizar gráficos.
+        """
+        self.last_chart_data = []
+        self.last_turn_ok = True
+        self.last_turn_ttl = None
+        reply = _trivial_reply(user_message)
+        if reply:
+            self.record_exchange(user_message, reply)
+            yield reply
+            return
+
+        self._refresh_system_prompt()
+        self.messages.append({"role": "user", "content": user_message})
+        self._trim_history()
+        self._turn_api = _TurnFetches(self.api)
+
+        for _ in range(MAX_ITERATIONS):
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+                tools=TOOLS,
+                tool_choice="auto",
+                parallel_tool_calls=True,
+                extra_body={"prompt_cache_key": f"utopia-{self.tenant_id}"},
+                stream=True,
+            )
+
+            content_parts: list[str] = []
+            tool_calls: dict[int, dict] = {}
+            started: dict[int, Future] = {}
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield delta.content
+                for tc in delta.tool_calls or []:
+                    if tc.index not in tool_calls:
+                        # Empieza otra llamada: las anteriores ya tienen sus argumentos
+                        # completos y se ejecutan mientras el modelo sigue generando.
+                        for i, prev in tool_calls.items():
+                            if i not in started:
+                                started[i] = _tool_pool.submit(
+                                    self._execute_tool,
+                                    prev["function"]["name"],
+                                    prev["function"]["arguments"],
+                                )
+                    call = tool_calls.setdefault(tc.index, {
+                        "id": "",
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""},
+                    })
+                    if tc.id:
+                        call["id"] = tc.id
+                    if tc.function:
+                        call["function"]["name"] += tc.function.name or ""
+                        call["function"]["arguments"] += tc.function.arguments or ""
+
+            message = {"role": "assistant", "content": "".join(content_parts) or None}
+            if tool_calls:
+                message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+            self.messages.append(message)
+
+            if not tool_calls:
+                return
+
+            self._run_tool_calls(
+                [
+                    (call["id"], call["function"]["name"], call["function"]["arguments"])
+                    for call in message["tool_calls"]
+                ],
+                self.last_chart_data,
+                [started.get(i) for i in sorted(tool_calls)],
+            )
+
+        self.last_turn_ok = False
+        yield FALLBACK_RESPONSE
+
+    def _run_tool_calls(
+        self,
+        calls: list[tuple[str, str, str]],
+        chart_data: list[tuple[str, dict]],
+        started: Optional[list[Optional[Future]]] = None,
+    ):
+        """
+        Ejecuta las llamadas (id, nombre, argumentos) de una misma ronda en
+        paralelo y agrega sus resultados a self.messages en el orden original.
+        started trae, por posición, las llamadas que ya se lanzaron durante el stream.
+        """
+        started = started or [None] * len(calls)
+        if len(calls) == 1 and started[0] is None:
+            results = [self._execute_tool(calls[0][1], calls[0][2])]
+        else:
+            futures = [
+                fut or _tool_pool.submit(self._execute_tool, fn_name, arguments)
+                for (_, fn_name, arguments), fut in zip(calls, started)
+            ]
+            results = [fut.result() for fut in futures]
+
+        for (call_id, fn_name, _), (result, result_str, ttl) in zip(calls, results):
+            if result is None:
+                self.last_turn_ok = False
+            else:
+                chart_data.append((fn_name, result))
+                self.last_turn_ttl = ttl if self.last_turn_ttl is None else min(self.last_turn_ttl, ttl)
+            self.messages.append({
+                "role": "tool",
+                "tool_call_id": call_id,
+                "content": result_str,
+            })
+
+    def _execute_tool(self, fn_name: str, arguments: str) -> tuple[Optional[dict], str, Optional[int]]:
+        """
+        Ejecuta una herramienta. Retorna (resultado o None si falló, contenido
+        para el modelo, segundos de vigencia del resultado o None si falló).
+        """
+        try:
+            fn_args = orjson.loads(arguments)
+            if not isinstance(fn_args, dict):
+                raise TypeError("se esperaba un objeto JSON")
+        except (orjson.JSONDecodeError, TypeError) as e:
+            # Argumentos mal formados del modelo: la llamada igual necesita su respuesta.
+            return None, orjson.dumps({"error": f"Argumentos inválidos: {e}"}).decode(), None
+
+        executor = TOOL_EXECUTORS.get(fn_name)
+        if not executor:
+            return None, orjson.dumps({"error": f"Herramienta desconocida: {fn_name}"}).decode(), None
+
+        key = (fn_name, self.tenant_id, orjson.dumps(fn_args, option=orjson.OPT_SORT_KEYS))
+        ttl = _tool_cache_ttl(fn_args)
+        now = time.monotonic()
+        with _tool_cache_lock:
+            hit = _tool_cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1], hit[2], ttl
+
+        try:
+            result = executor(self._turn_api, self.tenant_id, fn_args)
+            # Compacto y en UTF-8 (sin escapes \uXXXX): menos tokens para el modelo.
+            result_str = orjson.dumps(result, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+        except Exception as e:
+            return None, orjson.dumps({"error": str(e)}).decode(), None
+
+        with _tool_cache_lock:
+            _tool_cache[key] = (now + ttl, result, result_str)
+            if len(_tool_cache) > TOOL_CACHE_SIZE:
+                _tool_cache.pop(next(iter(_tool_cache)), None)
+        return result, result_str, ttl
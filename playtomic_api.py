@@ -5,12 +5,51 @@ Handles OAuth2 authentication, bookings, players, and availability queries
 for the Playtomic club management platform.
 """
 
+import hashlib
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from zoneinfo import ZoneInfo
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_PLAYER_INCLUDE = "BENEFITS,SPORTS,WALLETS"
+
+# Largest window of pages fetched concurrently once a bookings query spills
+# past its first page.
+PAGE_PREFETCH = 4
+
+# Shared by all clients; page fetches never submit further work, so callers
+# running on other pools can safely wait on it.
+_page_pool = ThreadPoolExecutor(max_workers=2 * PAGE_PREFETCH, thread_name_prefix="playtomic-pages")
+
+# Transient failures (rate limits, gateway errors) are retried by the session
+# with exponential backoff, honoring Retry-After; a failing page no longer
+# throws away the pages already fetched. After the last attempt the response
+# is returned as-is so raise_for_status() reports the real status.
+_RETRY_OPTIONS = dict(
+    total=4,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET", "POST"}),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+try:
+    _RETRY = Retry(**_RETRY_OPTIONS, backoff_jitter=0.5)  # jitter needs urllib3 >= 2
+except TypeError:
+    _RETRY = Retry(**_RETRY_OPTIONS)
+
+# Bearer tokens shared by every client with the same credentials:
+# sha256(client_id:secret) -> (token, expires_at). The lock also makes sure
+# only one thread requests a new token while the others wait for it.
+_token_cache: dict[str, tuple[str, float]] = {}
+_token_lock = threading.Lock()
 
 
 class PlaytomicAPI:
@@ -25,6 +64,13 @@ class PlaytomicAPI:
         self.club_tz = ZoneInfo(tz_name)
         self._token: Optional[str] = None
         self._token_expires_at: float = 0
+        self._credentials_key = hashlib.sha256(f"{client_id}:{client_secret}".encode()).hexdigest()
+        # One keep-alive session for every call: pages, retries and the token
+        # request reuse open connections instead of a new TCP+TLS handshake each.
+        # pool_maxsize covers the tool threads plus concurrent page fetches.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_RETRY)
+        self._session.mount("https://", adapter)
 
     def _local_day_to_utc_range(self, local_date: datetime) -> tuple[datetime, datetime]:
         """
@@ -40,24 +86,50 @@ class PlaytomicAPI:
     # ── Authentication ──────────────────────────────────────────────────
 
     def _ensure_token(self):
-        """Obtain or refresh the OAuth2 bearer token."""
+        """Obtain or refresh the OAuth2 bearer token (shared across instances)."""
         if self._token and time.time() < self._token_expires_at - 60:
             return
-        resp = requests.post(
-            f"{self.THIRD_PARTY_BASE}/oauth/token",
-            json={"client_id": self.client_id, "secret": self.client_secret},
-            headers={"Content-Type": "application/json"},
-            timeout=30,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        self._token = data["token"]
-        self._token_expires_at = time.time() + data.get("expires_in", 3600)
+        with _token_lock:
+            cached = _token_cache.get(self._credentials_key)
+            if cached and time.time() < cached[1] - 60:
+                self._token, self._token_expires_at = cached
+                return
+            resp = self._session.post(
+                f"{self.THIRD_PARTY_BASE}/oauth/token",
+                json={"client_id": self.client_id, "secret": self.client_secret},
+                headers={"Content-Type": "application/json"},
+                timeout=30,
+            )
+            resp.raise_for_status()
+            data = orjson.loads(resp.content)
+            self._token = data["token"]
+            self._token_expires_at = time.time() + data.get("expires_in", 3600)
+            _token_cache[self._credentials_key] = (self._token, self._token_expires_at)
+
+    def _invalidate_token(self, token: str):
+        """Drop a token the API rejected, unless another thread already replaced it."""
+        with _token_lock:
+            cached = _token_cache.get(self._credentials_key)
+            if cached and cached[0] == token:
+                del _token_cache[self._credentials_key]
+            if self._token == token:
+                self._token = None
+                self._token_expires_at = 0
 
     def _headers(self) -> dict:
         self._ensure_token()
         return {"Authorization": f"Bearer {self._token}"}
 
+    def _authorized_get(self, url: str, params: Optional[dict] = None):
+        """GET on the third-party API; on a 401 the token is renewed and the call retried once."""
+        headers = self._headers()
+        resp = self._session.get(url, params=params, headers=headers, timeout=30)
+        if resp.status_code == 401:
+            self._invalidate_token(headers["Authorization"].removeprefix("Bearer "))
+            resp = self._session.get(url, params=params, headers=self._headers(), timeout=30)
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
+
     # ── Bookings ────────────────────────────────────────────────────────
 
     def get_bookings(
@@ -71,43 +143,55 @@ class PlaytomicAPI:
         page: int = 0,
         size: int = 200,
     ) -> list[dict]:
-        """Fetch bookings for a tenant within a date range. Returns all pages."""
-        all_bookings = []
-        current_page = page
-
-        while True:
-            params = {
-                "tenant_id": tenant_id,
-                "start_booking_date": start_date.strftime("%Y-%m-%dT%H:%M:%S"),
-                "end_booking_date": end_date.strftime("%Y-%m-%dT%H:%M:%S"),
-                "sport_id": sport_id,
-                "page": current_page,
-                "size": size,
-            }
-            if booking_type:
-                params["booking_type"] = booking_type
-            if status:
-                params["status"] = status
-
-            resp = requests.get(
-                f"{self.THIRD_PARTY_BASE}/bookings",
-                params=params,
-                headers=self._headers(),
-                timeout=30,
-            )
-            resp.raise_for_status()
-            bookings = resp.json()
-
-            if not bookings:
-                break
+        """
+        Fetch bookings for a tenant within a date range. Returns all pages.
 
-            all_bookings.extend(bookings)
+        The first page is fetched alone (most queries fit in it); after that,
+        pages are requested in concurrent windows that grow 1, 2, 4... up to
+        PAGE_PREFETCH, and are consumed in order until one comes back short.
+        Speculative pages that turn out to be unneeded are cancelled if they
+        have not started yet.
+        """
+        params = {
+            "tenant_id": tenant_id,
+            "start_booking_date": start_date.strftime("%Y-%m-%dT%H:%M:%S"),
+            "end_booking_date": end_date.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sport_id": sport_id,
+            "size": size,
+        }
+        if booking_type:
+            params["booking_type"] = booking_type
+        if status:
+            params["status"] = status
 
-            if len(bookings) < size:
-                break
-            current_page += 1
+        all_bookings = self._get_bookings_page(params, page)
+        if len(all_bookings) < size:
+            return all_bookings
 
-        return all_bookings
+        next_page = page + 1
+        window_size = 1
+        while True:
+            window = [
+                _page_pool.submit(self._get_bookings_page, params, p)
+                for p in range(next_page, next_page + window_size)
+            ]
+            try:
+                for future in window:
+                    bookings = future.result()
+                    if not bookings:
+                        return all_bookings
+                    all_bookings.extend(bookings)
+                    if len(bookings) < size:
+                        return all_bookings
+            finally:
+                for future in window:
+                    future.cancel()
+            next_page += window_size
+            window_size = min(window_size * 2, PAGE_PREFETCH)
+
+    def _get_bookings_page(self, params: dict, page: int) -> list[dict]:
+        """Fetch a single page of bookings."""
+        return self._authorized_get(f"{self.THIRD_PARTY_BASE}/bookings", {**params, "page": page})
 
     def get_bookings_for_date(
         self, tenant_id: str, date: datetime, sport_id: str = "PADEL"
@@ -150,13 +234,13 @@ class PlaytomicAPI:
             "local_start_min": start_min.strftime("%Y-%m-%dT%H:%M:%S"),
             "local_start_max": start_max.strftime("%Y-%m-%dT%H:%M:%S"),
         }
-        resp = requests.get(
+        resp = self._session.get(
             f"{self.PUBLIC_BASE}/availability",
             params=params,
             timeout=30,
         )
         resp.raise_for_status()
-        return resp.json()
+        return orjson.loads(resp.content)
 
     # ── Players ─────────────────────────────────────────────────────────
 
@@ -168,22 +252,13 @@ class PlaytomicAPI:
     ) -> list[dict]:
         """Fetch all players for a venue using cursor pagination."""
         all_players = []
-        cursor_id = None
-        inc = include or ["BENEFITS", "SPORTS", "WALLETS"]
+        params = {
+            "limit": limit,
+            "include": ",".join(include) if include else DEFAULT_PLAYER_INCLUDE,
+        }
 
         while True:
-            params = {"limit": limit, "include": ",".join(inc)}
-            if cursor_id:
-                params["cursor_id"] = cursor_id
-
-            resp = requests.get(
-                f"{self.THIRD_PARTY_BASE}/venues/{venue_id}/players",
-                params=params,
-                headers=self._headers(),
-                timeout=30,
-            )
-            resp.raise_for_status()
-            data = resp.json()
+            data = self._authorized_get(f"{self.THIRD_PARTY_BASE}/venues/{venue_id}/players", params)
 
             players = data.get("data", [])
             all_players.extend(players)
@@ -193,18 +268,13 @@ class PlaytomicAPI:
             cursor_id = data.get("next_cursor_id")
             if not cursor_id:
                 break
+            params["cursor_id"] = cursor_id
 
         return all_players
 
     def get_player(self, venue_id: str, player_id: str) -> dict:
         """Fetch a single player by ID."""
-        resp = requests.get(
-            f"{self.THIRD_PARTY_BASE}/venues/{venue_id}/players/{player_id}",
-            headers=self._headers(),
-            timeout=30,
-        )
-        resp.raise_for_status()
-        return resp.json()
+        return self._authorized_get(f"{self.THIRD_PARTY_BASE}/venues/{venue_id}/players/{player_id}")
 
     # ── Venue Discovery (Public API) ────────────────────────────────────
 
@@ -228,13 +298,13 @@ class PlaytomicAPI:
             params["coordinate"] = f"{coordinate['lat']},{coordinate['lon']}"
             params["radius"] = radius
 
-        resp = requests.get(
+        resp = self._session.get(
             f"{self.PUBLIC_BASE}/tenants",
             params=params,
             timeout=30,
         )
         resp.raise_for_status()
-        return resp.json()
+        return orjson.loads(resp.content)
 
     def search_venues_by_name(self, name: str, sport_id: str = "PADEL") -> list[dict]:
         """Search venues by name fragment."""
@@ -244,13 +314,13 @@ class PlaytomicAPI:
             "tenant_name": name,
             "size": 50,
         }
-        resp = requests.get(
+        resp = self._session.get(
             f"{self.PUBLIC_BASE}/tenants",
             params=params,
             timeout=30,
         )
         resp.raise_for_status()
-        return resp.json()
+        return orjson.loads(resp.content)
 
     # ── Convenience: test connection ────────────────────────────────────
 